@@ -1,45 +1,111 @@
+import argparse
+import glob
+import mmap
+import multiprocessing
+import os
 import re
-
-label = re.compile('[a-zA-Z][0-9a-zA-Z]*')
-hexadecimal = re.compile('x-?[0-9a-fA-F]+')
-decimal = re.compile('#?-?[0-9]+')
-binary = re.compile('b-?[0-1]+')
-reg = re.compile('[Rr][0-9]+')
-
-Opcode = {'ADD': '0001', 'AND': '0101', 'BRN': '0000100', 'BRZ': '0000010',
-          'BRP': '0000001', 'BR': '0000111', 'BRZP': '0000011', 'BRNP': '0000101',
-          'BRNZ': '0000110', 'BRNZP': '0000111', 'JMP': '1100', 'RET': '1000000111000000',
-          'JSRR': '0100', 'LD': '0010', 'LDI': '1010', 'LDR': '0110', 'LEA': '1110',
-          'NOT': '1001', 'RTI': '1000000000000000', 'ST': '0011', 'STI': '1011', 'STR': '0111',
-          'TRAP': '1111', 'GETC': '1111000000100000', 'OUT': '1111000000100001',
-          'PUTS': '1111000000100010', 'IN': '1111000000100011',
-          'PUTSP': '1111000000100100', 'HALT': '1111000000100101'}
-
-Pseudo_ops = {'.ORIG', '.FILL', '.BLKW', '.STRINGZ', '.END'}
+import sys
+import time
+from array import array
+from collections import namedtuple
+from contextlib import nullcontext
+from itertools import islice, repeat
+
+from diagnostics import Diagnostics, TooManyErrors, message, report
+from symbols import SymbolTable
+
+__version__ = '0.5.0'
+
+# one pass over a line, each token classified by the group it matches; a
+# string without its closing quote ends at the comment or the line end
+lexer = re.compile(r"""
+      [\s,]+
+    | (?P<comment>;.*)
+    | (?P<string>"(?:[^"\\\r\n]|\\[^\r\n])*"|"(?:[^"\\\r\n;]|\\[^\r\n])*\\?(?<!\s))
+    | (?P<reg>[Rr][0-9]+)(?=[\s,;]|$)
+    | (?P<hex>x-?[0-9a-fA-F]+)(?=[\s,;]|$)
+    | (?P<dec>\#?-?[0-9]+)(?=[\s,;]|$)
+    | (?P<bin>b-?[0-1]+)(?=[\s,;]|$)
+    | (?P<label>[a-zA-Z][0-9a-zA-Z]*)(?=[\s,;]|$)
+    | (?P<pseudo>\.[a-zA-Z]+)(?=[\s,;]|$)
+    | (?P<bad>[^\s,;]+)
+""", re.VERBOSE)
+
+# column is where the token starts in its line
+Token = namedtuple('Token', ['kind', 'text', 'value', 'column'])
+
+def tokenize(line):
+    tokens = []
+    for match in lexer.finditer(line):
+        kind = match.lastgroup
+        if kind is None:
+            continue
+        if kind == 'comment':
+            break
+        text = match.group()
+        column = match.start()
+        if kind == 'label':
+            value = text.upper()
+            if value in Opcode:
+                tokens.append(Token('op', text, value, column))
+            else:
+                tokens.append(Token('label', text, text, column))
+        elif kind == 'reg':
+            tokens.append(Token('reg', text, int(text[1:]), column))
+        elif kind == 'hex':
+            tokens.append(Token('num', text, int(text[1:], base=16), column))
+        elif kind == 'dec':
+            tokens.append(Token('num', text, int(text.lstrip('#'), base=10), column))
+        elif kind == 'bin':
+            tokens.append(Token('num', text, int(text[1:], base=2), column))
+        elif kind == 'string':
+            tokens.append(Token('string', text, is_string(text), column))
+        elif kind == 'pseudo' and text.upper() in Pseudo_ops:
+            tokens.append(Token('pseudo', text, text.upper(), column))
+        else:
+            tokens.append(Token('bad', text, text, column))
+    return tokens
 
 
 def parse_line(line):
-    line = line.split(';')[0]
-    line = line.strip()
-    if not line:
+    elements = tokenize(line)
+    if not elements:
         return None
-    line = line.replace(',', ' ')
-    elements = line.split()
     return elements
 
 
+# a line of nothing but separators and maybe a comment
+Blank_line = re.compile(rb'[\s,]*(?:;|$)')
+Lone_cr = re.compile(rb'\r(?!\n)')
+
+
+# parse_line() over the lines of a memory mapped file: blank and comment only
+# lines become None without being decoded, and of the other lines only the
+# part before the comment is, unless a string may hold the ';'. Generated
+# sources repeat the same code over and over, so lines with the same code
+# share one token list instead of being lexed again
+def parse_mapped(source):
+    source.seek(0)
+    blank = Blank_line.match
+    lexed = {}
+    for line in iter(source.readline, b''):
+        if blank(line):
+            yield None
+            continue
+        code = line if b'"' in line else line.partition(b';')[0]
+        tokens = lexed.get(code)
+        if tokens is None:
+            tokens = lexed[code] = parse_line(code.decode('utf-8'))
+        yield tokens
+
+
 def is_number(element):
-    if hexadecimal.fullmatch(element) \
-            or decimal.fullmatch(element) \
-            or binary.fullmatch(element):
-        return True
-    else:
-        return False
+    return element.kind == 'num'
 
 
 def is_string(string):
-    if string[0] != '"' or string[-1] != '"':
-        return False
+    if len(string) < 2 or string[0] != '"' or string[-1] != '"':
+        return None
     string = string[1:-1]
     char_map = {'0': '\0', 'a': '\a', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t', 'v': '\v'}
     true_string = ''
@@ -54,51 +120,25 @@ def is_string(string):
             else:
                 true_string += char
         elif char == '"':
-            return False
+            return None
         else:
             true_string += char
+    if need:
+        return None
     return true_string
 
 
-def str2num(element):
-    if element.startswith('x'):
-        return int(element[1:], base=16)
-    elif element.startswith('b'):
-        return int(element[1:], base=2)
-    elif element.startswith('#'):
-        return int(element[1:], base=10)
-    else:
-        return int(element, base=10)
-
-
-def num2bin(num, bits, signed=True):
-    if num < 0 and not signed:
-        return ''
-    bins = bin(num)[2:] if num > 0 else bin(num)[3:]
-    if not signed:
-        return '0' * (bits - len(bins)) + bins
-    else:
-        if num >= 0:
-            return '0' * (bits - len(bins)) + bins
-        else:
-            tc = bin(2 ** len(bins) + num)[2:]
-            return '1' * (bits - len(bins)) + '0' * (len(bins) - len(tc)) + tc
+def field(num, bits):
+    return num & ((1 << bits) - 1)
 
 
 def is_label(element):
-    if element.upper() not in Opcode \
-            and element.upper() not in Pseudo_ops \
-            and not is_number(element) \
-            and not reg.fullmatch(element):
-        return True
-    else:
-        return False
+    return element.kind == 'label' or element.kind == 'bad'
 
 
 def valid_label(l, line_no, error):
-    if not label.fullmatch(l):
-        error.append('Line {}:Invalid label \'{}\''
-                     .format(line_no, l))
+    if l.kind != 'label':
+        report(error, 'invalid_label', line_no, l.column, l.text)
         return False
     else:
         return True
@@ -107,41 +147,35 @@ def valid_label(l, line_no, error):
 # check if operands satisfy need
 def valid_operands(operands, need, line_no, error):
     if operands and not need:
-        error.append('Line {}:\'{}...\' is redundant'
-                     .format(line_no, operands[0]))
+        report(error, 'redundant_operand', line_no, operands[0].column, operands[0].text)
         return False
     if not operands and need:
-        error.append('Line {}:Expected more operand(s)'
-                     .format(line_no))
+        report(error, 'missing_operand', line_no, None)
         return False
     return True
 
 
 def is_value_operand(operand, line_no, error):
     if not is_number(operand):
-        error.append('Line {}:Expected 16 bit value, but found \'{}\' instead'
-                     .format(line_no, operand))
+        report(error, 'expected_value', line_no, operand.column, operand.text)
         return False
     else:
-        value = str2num(operand)
+        value = operand.value
         if value < -32768 or value > 65535:
-            error.append('Line {}:{} can not be represented as an unsigned number in 16 bits'
-                         .format(line_no, value))
+            report(error, 'value_range', line_no, operand.column, value)
             return False
         else:
             return True
 
 
 def is_reg_operand(operand, line_no, error):
-    if not reg.fullmatch(operand):
-        error.append('Line {}:Expected register operand, but found \'{}\' instead'
-                     .format(line_no, operand))
+    if operand.kind != 'reg':
+        report(error, 'expected_register', line_no, operand.column, operand.text)
         return False
     else:
-        reg_no = int(operand[1:], base=10)
+        reg_no = operand.value
         if reg_no > 7:
-            error.append('Line {}:Register {} does not exist'
-                         .format(line_no, reg_no))
+            report(error, 'bad_register', line_no, operand.column, reg_no)
             return False
         else:
             return True
@@ -149,10 +183,9 @@ def is_reg_operand(operand, line_no, error):
 
 def is_label_or_offset_operand(operand, pcoffset, line_no, error):
     if is_number(operand):
-        offset = str2num(operand)
+        offset = operand.value
         if offset > 2 ** (pcoffset - 1) - 1 or offset < -2 ** (pcoffset - 1):
-            error.append('Line {}:{} can not be represented as a signed number in {} bits'
-                         .format(line_no, offset, pcoffset))
+            report(error, 'signed_range', line_no, operand.column, offset, pcoffset)
             return False
         return True
     elif is_label(operand):
@@ -160,311 +193,470 @@ def is_label_or_offset_operand(operand, pcoffset, line_no, error):
             return False
         return True
     else:
-        error.append('Line {}:Expected label or {} bit signed PC offset, but found \'{}\' instead'
-                     .format(line_no, pcoffset, operand))
+        report(error, 'expected_pcoffset', line_no, operand.column, pcoffset, operand.text)
         return False
 
 
-def parse_po(po, operands, LC, line_no, error):
-    if po.upper() == '.ORIG':
-        if LC[0] != -1:
-            error.append('Line {}:Duplicate pseudo_op \'.ORIG\''
-                         .format(line_no))
-        if not valid_operands(operands, True, line_no, error):
-            return
+def valid_refer(refer, pcoffset, LC, line_no, error, symbol_table):
+    if refer.text not in symbol_table:
+        report(error, 'undefined_label', line_no, refer.column, refer.text)
+        return False
+    else:
+        offset = symbol_table.loc(refer.text) - (LC + 1)
+        if offset > 2 ** (pcoffset - 1) - 1 or offset < -2 ** (pcoffset - 1):
+            report(error, 'label_range', line_no, refer.column, refer.text, pcoffset)
+            return False
         else:
-            if is_value_operand(operands[0], line_no, error):
-                LC[0] = str2num(operands[0])
-        valid_operands(operands[1:], False, line_no, error)
+            return True
 
-    if po.upper() == '.FILL':
-        if not valid_operands(operands, True, line_no, error):
-            return
-        else:
-            if is_label(operands[0]):
-                valid_label(operands[0], line_no, error)
-            elif is_value_operand(operands[0], line_no, error):
-                LC[0] += 1
-        valid_operands(operands[1:], False, line_no, error)
-
-    if po.upper() == '.BLKW':
-        if not valid_operands(operands, True, line_no, error):
-            return
-        else:
-            if is_value_operand(operands[0], line_no, error):
-                LC[0] += str2num(operands[0])
-        valid_operands(operands[1:], False, line_no, error)
 
-    if po.upper() == '.STRINGZ':
-        if not valid_operands(operands, True, line_no, error):
-            return
-        else:
-            if not is_string(operands[0]):
-                error.append('Line {}:Expected string constant, but found \'{}\' instead'
-                             .format(line_no, operands[0]))
-            else:
-                LC[0] += len(is_string(operands[0])) + 1
-        valid_operands(operands[1:], False, line_no, error)
+def parse_orig(operands, LC, line_no, error, symbol_table):
+    if LC[0] != -1:
+        report(error, 'duplicate_orig', line_no, None)
+    if not valid_operands(operands, True, line_no, error):
+        return
+    else:
+        if is_value_operand(operands[0], line_no, error):
+            LC[0] = field(operands[0].value, 16)
+    valid_operands(operands[1:], False, line_no, error)
 
 
-def parse_op(op, operands, line_no, error):
-    if op.upper() in {'ADD', 'AND'}:
-        if not valid_operands(operands, True, line_no, error):
-            return
-        else:
-            is_reg_operand(operands[0], line_no, error)
-        if not valid_operands(operands[1:], True, line_no, error):
-            return
-        else:
-            is_reg_operand(operands[1], line_no, error)
-        if not valid_operands(operands[2:], True, line_no, error):
-            return
+def parse_fill(operands, LC, line_no, error, symbol_table):
+    if not valid_operands(operands, True, line_no, error):
+        return
+    else:
+        if is_label(operands[0]):
+            valid_label(operands[0], line_no, error)
         else:
-            if is_number(operands[2]):
-                imm = str2num(operands[2])
-                if imm > 15 or imm < -16:
-                    error.append('Line {}:{} can not be represented as a signed number in 5 bits'
-                                 .format(line_no, imm))
-            elif reg.fullmatch(operands[2]):
-                is_reg_operand(operands[2], line_no, error)
-            else:
-                error.append('Line {}:Expected register or immediate value, but found \'{}\' instead'
-                             .format(line_no, operands[2]))
-        valid_operands(operands[3:], False, line_no, error)
+            is_value_operand(operands[0], line_no, error)
+        LC[0] += 1
+    valid_operands(operands[1:], False, line_no, error)
 
-    if op.upper() == 'NOT':
-        if not valid_operands(operands, True, line_no, error):
-            return
-        else:
-            is_reg_operand(operands[0], line_no, error)
-        if not valid_operands(operands[1:], True, line_no, error):
-            return
-        else:
-            is_reg_operand(operands[1], line_no, error)
-        valid_operands(operands[2:], False, line_no, error)
 
-    if op.upper() in {'LD', 'LDI', 'LEA', 'ST', 'STI'}:
-        if not valid_operands(operands, True, line_no, error):
-            return
-        else:
-            is_reg_operand(operands[0], line_no, error)
-        if not valid_operands(operands[1:], True, line_no, error):
-            return
-        else:
-            is_label_or_offset_operand(operands[1], 9, line_no, error)
-        valid_operands(operands[2:], False, line_no, error)
+def parse_blkw(operands, LC, line_no, error, symbol_table):
+    if not valid_operands(operands, True, line_no, error):
+        return
+    else:
+        if is_value_operand(operands[0], line_no, error):
+            LC[0] += field(operands[0].value, 16)
+    valid_operands(operands[1:], False, line_no, error)
 
-    if op.upper() in {'LDR', 'STR'}:
-        if not valid_operands(operands, True, line_no, error):
-            return
-        else:
-            is_reg_operand(operands[0], line_no, error)
-        if not valid_operands(operands[1:], True, line_no, error):
-            return
-        else:
-            is_reg_operand(operands[1], line_no, error)
-        if not valid_operands(operands[2:], True, line_no, error):
-            return
-        else:
-            if is_number(operands[2]):
-                offset6 = str2num(operands[2])
-                if offset6 > 31 or offset6 < -32:
-                    error.append('Line {}:{} can not be represented as a signed number in 6 bits'
-                                 .format(line_no, offset6))
-            else:
-                error.append('Line {}:Expected 6 bit signed number, but found \'{}\' instead'
-                             .format(line_no, operands[2]))
-        valid_operands(operands[3:], False, line_no, error)
-
-    if op.upper() in {'BRN', 'BRZ', 'BRP', 'BR', 'BRZP', 'BRNP',
-                      'BRNZ', 'BRNZP', 'JSR'}:
-        if op.upper() == 'JSR':
-            is_label_or_offset_operand(operands[0], 11, line_no, error)
-        else:
-            is_label_or_offset_operand(operands[0], 9, line_no, error)
-        valid_operands(operands[1:], False, line_no, error)
 
-    if op.upper() in {'JSRR', 'JMP'}:
-        if not valid_operands(operands, True, line_no, error):
-            return
+def parse_stringz(operands, LC, line_no, error, symbol_table):
+    if not valid_operands(operands, True, line_no, error):
+        return
+    else:
+        if operands[0].kind != 'string' or operands[0].value is None:
+            report(error, 'expected_string', line_no, operands[0].column, operands[0].text)
+        elif max(operands[0].value, default='\0') > '\uffff':
+            report(error, 'wide_string', line_no, operands[0].column, operands[0].text)
         else:
-            is_reg_operand(operands[0], line_no, error)
-        valid_operands(operands[1:], False, line_no, error)
-
-    if op.upper() == 'TRAP':
-        if is_number(operands[0]):
-            vector8 = str2num(operands[0])
-            if vector8 > 255 or vector8 < 0:
-                error.append('Line {}:{} can not be represented as an 8 bit trap vector'
-                             .format(line_no, vector8))
+            LC[0] += len(operands[0].value) + 1
+    valid_operands(operands[1:], False, line_no, error)
+
+
+def convert_orig(operands, LC, line_no, error, symbol_table):
+    return [field(operands[0].value, 16)]
+
+
+def convert_fill(operands, LC, line_no, error, symbol_table):
+    if is_label(operands[0]):
+        if operands[0].text in symbol_table.externals:
+            return [0]  # filled in by the linker
+        if operands[0].text not in symbol_table:
+            report(error, 'undefined_label', line_no, operands[0].column, operands[0].text)
+            return []
         else:
-            error.append('Line {}:Expected 8 bit non-negative trap vector, but found \'{}\' instead'
-                         .format(line_no, operands[0]))
-        valid_operands(operands[1:], False, line_no, error)
+            return [field(symbol_table.loc(operands[0].text), 16)]
+    else:
+        return [field(operands[0].value, 16)]
 
-    if op.upper() in {'RET', 'RTI', 'GETC', 'OUT', 'PUTS', 'IN',
-                      'PUTSP', 'HALT'}:
-        valid_operands(operands, False, line_no, error)
 
+def convert_blkw(operands, LC, line_no, error, symbol_table):
+    return array('H', bytes(2 * field(operands[0].value, 16)))
 
-def valid_refer(refer, pcoffset, LC, line_no, error, symbol_table):
-    if refer not in symbol_table:
-        error.append('Line {}:Instruction references undefined label \'{}\''
-                     .format(line_no, refer))
-        return False
+
+def convert_stringz(operands, LC, line_no, error, symbol_table):
+    words = array('H', (operands[0].value + '\0').encode('utf-16-le'))
+    if sys.byteorder == 'big':
+        words.byteswap()
+    return words
+
+
+def parse_external(operands, LC, line_no, error, symbol_table):
+    if valid_operands(operands, True, line_no, error) and valid_label(operands[0], line_no, error):
+        symbol_table.externals.add(operands[0].text)
+    valid_operands(operands[1:], False, line_no, error)
+
+
+def parse_global(operands, LC, line_no, error, symbol_table):
+    if valid_operands(operands, True, line_no, error) and valid_label(operands[0], line_no, error):
+        symbol_table.globals.add(operands[0].text)
+    valid_operands(operands[1:], False, line_no, error)
+
+
+def convert_end(operands, LC, line_no, error, symbol_table):
+    return []
+
+
+def convert_external(operands, LC, line_no, error, symbol_table):
+    if operands[0].text in symbol_table:
+        report(error, 'external_defined', line_no, operands[0].column, operands[0].text)
+    return []
+
+
+def convert_global(operands, LC, line_no, error, symbol_table):
+    if operands[0].text not in symbol_table:
+        report(error, 'global_undefined', line_no, operands[0].column, operands[0].text)
+    return []
+
+
+# pseudo_op -> (pass 1 handler, pass 2 handler)
+Pseudo_ops = {'.ORIG': (parse_orig, convert_orig),
+              '.FILL': (parse_fill, convert_fill),
+              '.BLKW': (parse_blkw, convert_blkw),
+              '.STRINGZ': (parse_stringz, convert_stringz),
+              '.END': (None, convert_end),
+              '.EXTERNAL': (parse_external, convert_external),
+              '.GLOBAL': (parse_global, convert_global)}
+
+
+def check_reg(operand, line_no, error):
+    is_reg_operand(operand, line_no, error)
+
+
+def check_imm5_or_reg(operand, line_no, error):
+    if is_number(operand):
+        imm = operand.value
+        if imm > 15 or imm < -16:
+            report(error, 'signed_range', line_no, operand.column, imm, 5)
+    elif operand.kind == 'reg':
+        is_reg_operand(operand, line_no, error)
     else:
-        offset = symbol_table[refer]['loc'] - (LC + 1)
-        if offset > 2 ** (pcoffset - 1) - 1 or offset < -2 ** (pcoffset - 1):
-            error.append('Line {}:Instruction references label \'{}\' that '
-                         'cannot be represented in a {} bit signed PC offset'
-                         .format(line_no, refer, pcoffset))
-            return False
-        else:
-            return True
+        report(error, 'expected_imm5_or_reg', line_no, operand.column, operand.text)
 
 
-def convert(instrcution, LC, line_no, error, symbol_table):
-    head = instrcution[0].upper()
-    if head == '.ORIG':
-        return [num2bin(str2num(instrcution[1]), 16, True)]
-    if head == '.FILL':
-        if is_label(instrcution[1]):
-            if instrcution[1] not in symbol_table:
-                error.append('Line {}:Instruction references undefined label \'{}\''
-                             .format(line_no, instrcution[1]))
-                return ['']
-            else:
-                return [num2bin(symbol_table[instrcution[1]['loc']], 16, False)]
-        else:
-            return [num2bin(str2num(instrcution[1]), 16, True)]
-    if head == '.BLKW':
-        loc_num = str2num(instrcution[1])
-        return ['0' * 16] * (loc_num if loc_num >= 0 else 65536 + loc_num)
-    if head == '.STRINGZ':
-        return [num2bin(ord(char), 16, False) for char in is_string(instrcution[1])] + ['0' * 16]
-    if head == 'ADD' or head.upper() == 'AND':
-        return [Opcode[head] + num2bin(str2num(instrcution[1][1:]), 3, False) + \
-                num2bin(str2num(instrcution[2][1:]), 3, False) + \
-                ('1' + num2bin(str2num(instrcution[3]), 5, True) if is_number(instrcution[3])
-                 else ('000' + num2bin(str2num(instrcution[3][1:]), 3, False)))]
-    if head == 'NOT':
-        return [Opcode[head] + num2bin(str2num(instrcution[1][1:]), 3, False) + \
-                num2bin(str2num(instrcution[2][1:]), 3, False) + '1' * 6]
-    if head in {'LD', 'LDI', 'LEA', 'ST', 'STI'}:
-        if is_label(instrcution[2]):
-            if not valid_refer(instrcution[2], 9, LC, line_no, error, symbol_table):
-                return ''
-            else:
-                return [Opcode[head] + num2bin(str2num(instrcution[1][1:]), 3, False) + \
-                        num2bin(symbol_table[instrcution[2]]['loc'] - (LC + 1), 9, True)]
-        return [Opcode[head] + num2bin(str2num(instrcution[1][1:]), 3, False) + \
-                num2bin(str2num(instrcution[2]), 9, True)]
-    if head in {'LDR', 'STR'}:
-        return [Opcode[head] + num2bin(str2num(instrcution[1][1:]), 3, False) + \
-                num2bin(str2num(instrcution[2][1:]), 3, False) + \
-                num2bin(str2num(instrcution[3]), 6, True)]
-    if head in {'BRN', 'BRZ', 'BRP', 'BR', 'BRZP', 'BRNP', 'BRNZ', 'BRNZP'}:
-        if is_label(instrcution[1]):
-            if not valid_refer(instrcution[1], 9, LC, line_no, error, symbol_table):
-                return ''
-            else:
-                return [Opcode[head] + num2bin(symbol_table[instrcution[1]]['loc'] - (LC + 1), 9, True)]
-        else:
-            return [Opcode[head] + num2bin(str2num(instrcution[1]), 9, True)]
-    if head == 'JSR':
-        if is_label(instrcution[1]):
-            if not valid_refer(instrcution[1], 11, LC, line_no, error, symbol_table):
-                return ''
-            else:
-                return [Opcode[head] + '1' + num2bin(symbol_table[instrcution[1]]['loc'] - (LC + 1), 11, True)]
-        else:
-            return [Opcode[head] + '1' + num2bin(str2num(instrcution[1]), 11, True)]
-    if head in {'JSRR', 'JMP'}:
-        return [Opcode[head] + '0' * 3 + num2bin(str2num(instrcution[1][1:]), 3, False) + '0' * 6]
-    if head == 'TRAP':
-        return [Opcode[head] + '0' * 4 + num2bin(str2num(instrcution[1]), 8, False)]
-    if head in {'RET', 'RTI', 'GETC', 'OUT', 'PUTS', 'IN',
-                'PUTSP', 'HALT'}:
-        return [Opcode[head]]
+def check_offset6(operand, line_no, error):
+    if is_number(operand):
+        offset6 = operand.value
+        if offset6 > 31 or offset6 < -32:
+            report(error, 'signed_range', line_no, operand.column, offset6, 6)
+    else:
+        report(error, 'expected_offset6', line_no, operand.column, operand.text)
+
+
+def check_pcoffset9(operand, line_no, error):
+    is_label_or_offset_operand(operand, 9, line_no, error)
+
 
+def check_pcoffset11(operand, line_no, error):
+    is_label_or_offset_operand(operand, 11, line_no, error)
 
-def pass1(file):
+
+def check_trapvect8(operand, line_no, error):
+    if is_number(operand):
+        vector8 = operand.value
+        if vector8 > 255 or vector8 < 0:
+            report(error, 'trap_range', line_no, operand.column, vector8)
+    else:
+        report(error, 'expected_trapvect8', line_no, operand.column, operand.text)
+
+
+def encode_reg(operand, LC, line_no, error, symbol_table):
+    return operand.value
+
+
+def encode_imm5_or_reg(operand, LC, line_no, error, symbol_table):
+    if is_number(operand):
+        return 0x20 | field(operand.value, 5)
+    return operand.value
+
+
+def encode_offset6(operand, LC, line_no, error, symbol_table):
+    return field(operand.value, 6)
+
+
+def encode_pcoffset(operand, pcoffset, LC, line_no, error, symbol_table):
+    if is_label(operand):
+        if operand.text in symbol_table.externals:
+            return 0  # filled in by the linker
+        if not valid_refer(operand, pcoffset, LC, line_no, error, symbol_table):
+            return None
+        return field(symbol_table.loc(operand.text) - (LC + 1), pcoffset)
+    return field(operand.value, pcoffset)
+
+
+def encode_pcoffset9(operand, LC, line_no, error, symbol_table):
+    return encode_pcoffset(operand, 9, LC, line_no, error, symbol_table)
+
+
+def encode_pcoffset11(operand, LC, line_no, error, symbol_table):
+    return encode_pcoffset(operand, 11, LC, line_no, error, symbol_table)
+
+
+def encode_trapvect8(operand, LC, line_no, error, symbol_table):
+    return operand.value
+
+
+# operand type -> (pass 1 checker, pass 2 encoder)
+Operand_types = {'reg': (check_reg, encode_reg),
+                 'imm5|reg': (check_imm5_or_reg, encode_imm5_or_reg),
+                 'offset6': (check_offset6, encode_offset6),
+                 'pcoffset9': (check_pcoffset9, encode_pcoffset9),
+                 'pcoffset11': (check_pcoffset11, encode_pcoffset11),
+                 'trapvect8': (check_trapvect8, encode_trapvect8)}
+
+# mnemonic -> (base word, ((operand type, shift), ...))
+Instruction_specs = {
+    'ADD': (0x1000, (('reg', 9), ('reg', 6), ('imm5|reg', 0))),
+    'AND': (0x5000, (('reg', 9), ('reg', 6), ('imm5|reg', 0))),
+    'NOT': (0x903F, (('reg', 9), ('reg', 6))),
+    'LD': (0x2000, (('reg', 9), ('pcoffset9', 0))),
+    'LDI': (0xA000, (('reg', 9), ('pcoffset9', 0))),
+    'LEA': (0xE000, (('reg', 9), ('pcoffset9', 0))),
+    'ST': (0x3000, (('reg', 9), ('pcoffset9', 0))),
+    'STI': (0xB000, (('reg', 9), ('pcoffset9', 0))),
+    'LDR': (0x6000, (('reg', 9), ('reg', 6), ('offset6', 0))),
+    'STR': (0x7000, (('reg', 9), ('reg', 6), ('offset6', 0))),
+    'BR': (0x0E00, (('pcoffset9', 0),)),
+    'BRN': (0x0800, (('pcoffset9', 0),)),
+    'BRZ': (0x0400, (('pcoffset9', 0),)),
+    'BRP': (0x0200, (('pcoffset9', 0),)),
+    'BRZP': (0x0600, (('pcoffset9', 0),)),
+    'BRNP': (0x0A00, (('pcoffset9', 0),)),
+    'BRNZ': (0x0C00, (('pcoffset9', 0),)),
+    'BRNZP': (0x0E00, (('pcoffset9', 0),)),
+    'JSR': (0x4800, (('pcoffset11', 0),)),
+    'JSRR': (0x4000, (('reg', 6),)),
+    'JMP': (0xC000, (('reg', 6),)),
+    'RET': (0xC1C0, ()),
+    'RTI': (0x8000, ()),
+    'TRAP': (0xF000, (('trapvect8', 0),)),
+    'GETC': (0xF020, ()),
+    'OUT': (0xF021, ()),
+    'PUTS': (0xF022, ()),
+    'IN': (0xF023, ()),
+    'PUTSP': (0xF024, ()),
+    'HALT': (0xF025, ()),
+}
+
+# mnemonic -> (base word, ((checker, encoder, shift), ...)), resolved once
+Instructions = {mnemonic: (base, tuple(Operand_types[kind] + (shift,) for kind, shift in signature))
+                for mnemonic, (base, signature) in Instruction_specs.items()}
+
+Opcode = {mnemonic: base for mnemonic, (base, _) in Instruction_specs.items()}
+
+
+def parse_op(op, operands, line_no, error):
+    signature = Instructions[op.value][1]
+    for idx, (check, _, _) in enumerate(signature):
+        if not valid_operands(operands[idx:], True, line_no, error):
+            return
+        check(operands[idx], line_no, error)
+    valid_operands(operands[len(signature):], False, line_no, error)
+
+
+def convert(instrcution, LC, line_no, error, symbol_table):
+    head = instrcution[0]
+    if head.kind == 'pseudo':
+        return Pseudo_ops[head.value][1](instrcution[1:], LC, line_no, error, symbol_table)
+    word, signature = Instructions[head.value]
+    for operand, (_, encode, shift) in zip(instrcution[1:], signature):
+        bits = encode(operand, LC, line_no, error, symbol_table)
+        if bits is None:
+            return []
+        word |= bits << shift
+    return [word]
+
+
+def pass1(file, path=None, depends=None):
+    return pass1_tokens(map(parse_line, file), path, depends)
+
+
+# pass 1 over lines that are already tokenized by parse_line(); path is where
+# .INCLUDE looks for files, see preprocess.py
+def pass1_tokens(parsed_lines, path=None, depends=None, error=None):
+    from preprocess import preprocess
     LC = [-1]  # Location Counter
-    error = []
-    symbol_table = dict()
+    if error is None:
+        error = []
+    symbol_table = SymbolTable()
     beyond_memory = False
     start = False
     instructions = []
     line_no = 0
-    for idx, line in enumerate(file):
-        line_no = idx + 1
-        parse_result = parse_line(line)
+    for line_no, parse_result in preprocess(parsed_lines, path, error, depends):
         if parse_result is None:
             continue
         if LC[0] > 65535 and not beyond_memory:
-            error.append('Line {}:Instruction uses memory beyond memory location xFFFF'
-                         .format(line_no))
+            report(error, 'memory_overflow', line_no, None)
             beyond_memory = True
         leader = parse_result[0]
-        if LC[0] == -1 and leader.upper() != '.ORIG' and not start:
-            error.append('Line {}:Expected .ORIG, but found \'{}\' instead'
-                         .format(line_no, leader))
+        if LC[0] == -1 and leader.value != '.ORIG' and not start:
+            report(error, 'expected_orig', line_no, leader.column, leader.text)
             start = True
         if is_label(leader):
             valid_label(leader, line_no, error)
-            if leader in symbol_table:
-                error.append('Line {}:Duplicate label \'{}\' with label on line {}'
-                             .format(line_no, leader, symbol_table[leader]['line']))
-            symbol_table[leader] = {'loc': LC[0], 'line': line_no}
+            if leader.text in symbol_table:
+                report(error, 'duplicate_label', line_no, leader.column, leader.text,
+                       symbol_table.line(leader.text))
+            symbol_table.add(leader.text, LC[0], line_no)
             instruction_part = parse_result[1:]
         else:
             instruction_part = parse_result
         if not instruction_part:
-            error.append('Line {}:Expected opcode or pseudo_op after \'{}\', but found nothing'
-                         .format(line_no, leader))
+            report(error, 'missing_opcode', line_no, leader.column, leader.text)
             continue
         instructions.append((line_no, LC[0], instruction_part))
         temp = instruction_part[0]
-        if temp.upper() not in Opcode and temp not in Pseudo_ops:
-            error.append('Line {}:Unrecognized opcode or pseudo_op at \'{}\''
-                         .format(line_no, temp))
+        if temp.kind != 'op' and temp.kind != 'pseudo':
+            report(error, 'unknown_opcode', line_no, temp.column, temp.text)
             continue
-        if temp.upper() == '.END':
+        if temp.value == '.END':
             return error, instructions, symbol_table
         operands = instruction_part[1:]
-        if temp.upper() in Pseudo_ops:
-            parse_po(temp, operands, LC, line_no, error)
-        if temp.upper() in Opcode:
+        if temp.kind == 'pseudo':
+            Pseudo_ops[temp.value][0](operands, LC, line_no, error, symbol_table)
+        else:
             parse_op(temp, operands, line_no, error)
             LC[0] += 1
-    error.append('Line {}:Expected \'.END\' at end of file'.format(line_no))
+    report(error, 'missing_end', line_no, None)
     return error, instructions, symbol_table
 
 
-def pass2(instructions, symbol_table):
-    error = []
-    results = []
-    for line_no, LC, instrcution in instructions:
-        result = convert(instrcution, LC, line_no, error, symbol_table)
-        if result:
-            results.extend(result)
+# after a clean pass 1 the list runs from .ORIG to .END, so the image size
+# is known up front and every word is stored at its own location
+def pass2(instructions, symbol_table, error=None):
+    if error is None:
+        error = []
+    orig = field(instructions[0][2][1].value, 16)
+    results = array('H', bytes(2 * (instructions[-1][1] - orig + 1)))
+    results[0] = orig
+    for line_no, LC, instrcution in instructions[1:]:
+        if instrcution[0].value == '.BLKW':
+            continue  # already zero-filled
+        words = convert(instrcution, LC, line_no, error, symbol_table)
+        start = LC - orig + 1
+        if len(words) == 1:
+            results[start] = words[0]
+        elif words:
+            results[start:start + len(words)] = words
     return error, results
 
 
-def assemble(input_text):
+# a large .BLKW is streamed as it is, without building its zero words
+def iter_pass2(instructions, symbol_table, error):
+    for line_no, LC, instrcution in instructions:
+        if instrcution[0].value == '.BLKW':
+            yield from repeat(0, field(instrcution[1].value, 16))
+        else:
+            yield from convert(instrcution, LC, line_no, error, symbol_table)
+
+
+# source may be any iterable of lines, e.g. an open file; words are
+# yielded as pass 2 encodes them and errors of both passes land in error as
+# diagnostics.Diagnostic records
+def assemble_stream(source, error):
+    error1, instructions, symbol_table = pass1(source)
+    error.extend(error1)
+    if not error1:
+        yield from iter_pass2(instructions, symbol_table, error)
+
+
+def timed(stats, phase):
+    return nullcontext() if stats is None else stats.phase(phase)
+
+
+# counts how much of the program is instructions and how much data, and the
+# largest single .FILL/.BLKW/.STRINGZ
+def count_words(stats, instructions):
+    largest = 0
+    for idx, (line_no, LC, instruction) in enumerate(instructions):
+        head = instruction[0]
+        if head.kind == 'op':
+            stats.count('instruction_words', 1)
+        elif head.value in ('.FILL', '.BLKW', '.STRINGZ'):
+            words = instructions[idx + 1][1] - LC
+            stats.count('data_words', words)
+            largest = max(largest, words)
+    stats.maximum('largest_data', largest)
+
+
+# input_text is the lines of the source or a memory map from open_source().
+# With a cache (see cache.BuildCache) an unchanged source is not lexed again;
+# formats decides whether the instruction list is kept for the .lst writer,
+# path is the source file, which .INCLUDE names are relative to, and stats
+# (see stats.Stats) collects timings and counts. diagnostics is filled with the
+# errors as diagnostics.Diagnostic records; with a limit the assembly stops
+# once that many were found, which is not cached
+def assemble_image(input_text, cache=None, formats=(), path=None, stats=None, diagnostics=None):
+    depends = []
+    error = Diagnostics() if diagnostics is None else diagnostics
+    mapped = isinstance(input_text, mmap.mmap)
+    if cache is not None:
+        with timed(stats, 'cache'):
+            if not mapped:
+                input_text = list(input_text)
+            key = cache.key(input_text, formats, path)
+            entry = cache.get(key)
+        if entry is not None:
+            if stats is not None:
+                stats.count('cache_hits', 1)
+            return entry
     success = False
-    results = []
+    results = array('H')
     assemble_infos = ["Assembling...", "Starting Pass 1..."]
-    error1, instructions, symbol_table = pass1(input_text)
-    assemble_infos.extend(error1)
+    lexed = parse_mapped(input_text) if mapped else map(parse_line, input_text)
+    if error.limit is None:
+        with timed(stats, 'lex'):
+            parsed_lines = list(lexed)
+    else:
+        # lexed as pass 1 reads it, so nothing past a stop is looked at
+        parsed_lines = lexed
+    stopped = False
+    try:
+        with timed(stats, 'pass1'):
+            error1, instructions, symbol_table = pass1_tokens(parsed_lines, path, depends, error)
+    except TooManyErrors:
+        error1, instructions, symbol_table = error, [], SymbolTable()
+        stopped = True
+    if stats is not None:
+        if error.limit is None:
+            stats.count('lines', len(parsed_lines))
+        stats.count('instructions', len(instructions))
+        stats.count('labels', len(symbol_table))
+        stats.count('errors', len(error1))
+    assemble_infos.extend(map(message, error1))
+    if stopped:
+        assemble_infos.append('Stopped after {} error(s)'.format(len(error1)))
     assemble_infos.append('Pass 1 - {} error(s)'.format(len(error1)))
     if not error1:
+        if stats is not None:
+            count_words(stats, instructions)
         assemble_infos.append("Starting Pass 2...")
-        error2, results = pass2(instructions, symbol_table)
-        assemble_infos.extend(error2)
+        try:
+            with timed(stats, 'pass2'):
+                error2, results = pass2(instructions, symbol_table, error)
+        except TooManyErrors:
+            error2, results = error, array('H')
+            stopped = True
+        if stats is not None:
+            stats.count('errors', len(error2))
+        assemble_infos.extend(map(message, error2))
+        if stopped:
+            assemble_infos.append('Stopped after {} error(s)'.format(len(error2)))
         assemble_infos.append('Pass 2 - {} error(s)'.format(len(error2)))
         if not error2:
             success = True
+    if cache is not None and not stopped:
+        cache.put(key, success, assemble_infos, results,
+                  instructions if 'lst' in formats or 'rel' in formats else [],
+                  symbol_table, depends)
+    return success, assemble_infos, results, instructions, symbol_table
+
+
+def assemble(input_text, cache=None, path=None):
+    success, assemble_infos, results, _, _ = assemble_image(input_text, cache, path=path)
     return success, assemble_infos, results
 
 
@@ -474,17 +666,252 @@ def open_file(path):
     return file
 
 
+# the source of path for assemble_image(): a read-only memory map, which is
+# lexed straight from its bytes without holding a str of every line, or the
+# lines of open_file() for an empty file or one with old Mac '\r' line ends.
+# A map should be closed after assembling
+def open_source(path):
+    with open(path, 'rb') as source_file:
+        try:
+            source = mmap.mmap(source_file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # an empty file can not be mapped
+            return []
+    if source.find(b'\r') >= 0 and Lone_cr.search(source):
+        source.close()
+        return open_file(path)
+    return source
+
+
+def bin_text(results):
+    return '\n'.join(format(result, '016b') for result in results)
+
+
+def listing_text(instruction, word):
+    head = instruction[0].value
+    if head == '.ORIG':
+        return '.ORIG x{:04X}'.format(word)
+    if head in Pseudo_ops:
+        return '.FILL x{:04X}'.format(word)
+    if word >> 12 == 0xF:
+        return 'TRAP  x{:02X}'.format(word & 0xFF)
+    if head == 'BR':
+        head = 'BRNZP'
+    operands = []
+    for operand in instruction[1:]:
+        if operand.kind == 'reg':
+            operands.append('R{}'.format(operand.value))
+        elif is_number(operand):
+            operands.append('#{}'.format(operand.value))
+        else:
+            operands.append(operand.text)
+    return '{:<6}{}'.format(head, ' '.join(operands)).rstrip()
+
+
+def listing_lines(results, instructions, symbol_table):
+    # by address, as lines of included files may share numbers with the main
+    # file; of several labels on one address the first defined is listed
+    labels = {}
+    for name, loc, _ in symbol_table.items():
+        labels.setdefault(loc, name)
+    orig = results[0]
+    for idx, (line_no, LC, instruction) in enumerate(instructions):
+        head = instruction[0].value
+        if head == '.ORIG':
+            LC, start, stop = 0, 0, 1
+        elif head == '.END':
+            return
+        else:
+            start = LC - orig + 1
+            stop = start + instructions[idx + 1][1] - LC
+        label = labels.pop(LC, '') if stop > start else ''
+        # the reference tools list .BLKW words against the line after it
+        if head == '.BLKW':
+            line_no += 1
+        for loc in range(start, stop):
+            word = results[loc]
+            yield '({:04X}) {:04X}  {:016b} ({:4d}) {:<16}{}\n'.format(
+                LC, word, word, line_no, label, listing_text(instruction, word))
+            LC += 1
+            label = ''
+
+
 def save_result(results, path):
-    result_file = open(path, 'w', encoding='utf-8')
-    for result in results:
-        result_file.write(result + '\n')
+    with open(path, 'w', encoding='utf-8', newline='\r\n') as result_file:
+        result_file.write(bin_text(results) + '\n')
+
+
+def save_obj(results, path):
+    words = array('H', results)
+    if sys.byteorder == 'little':
+        words.byteswap()
+    with open(path, 'wb') as obj_file:
+        obj_file.write(words.tobytes())
+
+
+def write_obj(words, obj_file, chunk_size=4096):
+    words = iter(words)
+    while True:
+        chunk = array('H', islice(words, chunk_size))
+        if not chunk:
+            break
+        if sys.byteorder == 'little':
+            chunk.byteswap()
+        obj_file.write(chunk.tobytes())
+
+
+def save_hex(results, path):
+    with open(path, 'w', encoding='utf-8', newline='\r\n') as hex_file:
+        hex_file.write(''.join('{:04X}\n'.format(result) for result in results))
+
+
+def save_sym(symbol_table, path):
+    with open(path, 'w', encoding='utf-8', newline='\r\n') as sym_file:
+        sym_file.write('//Symbol Name\t\tPage Address\n'
+                       '//----------------\t------------\n')
+        sym_file.writelines('//\t{:<23} {:04X}\n'.format(name, loc)
+                            for name, loc, _ in sorted(symbol_table.items()))
+
+
+def save_lst(results, instructions, symbol_table, path):
+    with open(path, 'w', encoding='utf-8', newline='\r\n') as lst_file:
+        lst_file.writelines(listing_lines(results, instructions, symbol_table))
+
+
+Output_formats = ('bin', 'obj', 'hex', 'sym', 'lst', 'rel')
+
+
+def save_outputs(base, results, instructions, symbol_table, formats=Output_formats):
+    if 'bin' in formats:
+        save_result(results, base + '.bin')
+    if 'obj' in formats:
+        save_obj(results, base + '.obj')
+    if 'hex' in formats:
+        save_hex(results, base + '.hex')
+    if 'sym' in formats:
+        save_sym(symbol_table, base + '.sym')
+    if 'lst' in formats:
+        save_lst(results, instructions, symbol_table, base + '.lst')
+    if 'rel' in formats:
+        from link import save_rel
+        save_rel(results, instructions, symbol_table, base + '.rel')
+
+
+def output_base(path, output_dir=None):
+    base = os.path.splitext(path)[0]
+    if output_dir:
+        base = os.path.join(output_dir, os.path.basename(base))
+    return base
+
+
+# stats is None, 'time' or 'memory'; the stats.Stats of the file is returned
+# last, or None. max_errors stops the assembly after that many errors
+def assemble_file(path, output_dir=None, formats=('bin',), cache_dir=None, stats=None, max_errors=None):
+    start = time.perf_counter()
+    if stats is not None:
+        from stats import Stats
+        stats = Stats(trace_memory=stats == 'memory')
+    cache = None
+    if cache_dir is not None:
+        from cache import shared_cache
+        cache = shared_cache(cache_dir)
+    try:
+        source = open_source(path)
+        try:
+            success, infos, results, instructions, symbol_table = assemble_image(
+                source, cache, formats, path, stats, Diagnostics(max_errors))
+        finally:
+            if isinstance(source, mmap.mmap):
+                source.close()
+    except (IOError, UnicodeDecodeError) as e:
+        return path, False, ['Can not read {}: {}'.format(path, e)], time.perf_counter() - start, stats
+    infos[0] = 'Assembling {}...'.format(path)
+    if success and symbol_table.externals and set(formats) & {'bin', 'obj', 'hex'}:
+        success = False
+        infos.append('{} uses .EXTERNAL labels, assemble it with -f rel and link it'.format(path))
+    if success:
+        with timed(stats, 'write'):
+            save_outputs(output_base(path, output_dir), results, instructions, symbol_table, formats)
+    return path, success, infos, time.perf_counter() - start, stats
+
+
+def expand_paths(patterns):
+    paths = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern, recursive=True))
+        paths.extend(matches if matches else [pattern])
+    return paths
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Assemble LC-3 source files.')
+    parser.add_argument('sources', nargs='+', help='.asm files or glob patterns')
+    parser.add_argument('-o', '--output-dir', help='write outputs here instead of next to each source')
+    parser.add_argument('-f', '--format', dest='formats', action='append', choices=Output_formats,
+                        help='output format, may be repeated (default: bin)')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1,
+                        help='number of worker processes (default: number of CPUs)')
+    parser.add_argument('-v', '--verbose', action='store_true',
+                        help='print assemble information for every file, not only failed ones')
+    parser.add_argument('--cache-dir',
+                        help='build cache directory (default: $LC3_CACHE_DIR or ~/.cache/lc3-assembler)')
+    parser.add_argument('--no-cache', action='store_true', help='always assemble from scratch')
+    parser.add_argument('--stats', nargs='?', const='time', choices=('time', 'memory'),
+                        help='print the time of each phase and counts for every file; '
+                             '--stats=memory also measures peak allocation (slower)')
+    parser.add_argument('--max-errors', type=int, metavar='N', help='stop a file after N errors')
+    parser.add_argument('--fail-fast', action='store_const', dest='max_errors', const=1,
+                        help='stop a file at its first error, the same as --max-errors 1')
+    args = parser.parse_args(argv)
+    formats = tuple(args.formats) if args.formats else ('bin',)
+    paths = expand_paths(args.sources)
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+    cache_dir = None
+    if not args.no_cache:
+        from cache import default_cache_dir
+        cache_dir = args.cache_dir or default_cache_dir()
+    jobs = [(path, args.output_dir, formats, cache_dir, args.stats, args.max_errors) for path in paths]
+    total = None
+    start = time.perf_counter()
+    failed = 0
+    if args.jobs > 1 and len(jobs) > 1:
+        pool = multiprocessing.Pool(min(args.jobs, len(jobs)))
+        reports = pool.imap(_assemble_job, jobs, chunksize=max(1, len(jobs) // (args.jobs * 8)))
+    else:
+        pool = None
+        reports = map(_assemble_job, jobs)
+    try:
+        for path, success, infos, elapsed, stats in reports:
+            if not success:
+                failed += 1
+            if args.verbose or not success:
+                for info in infos:
+                    print(info)
+            print('{}: {} ({:.1f} ms)'.format(path, 'ok' if success else 'failed', elapsed * 1000))
+            if stats is not None:
+                for line in stats.report():
+                    print('    ' + line)
+                if total is None:
+                    total = stats
+                else:
+                    total.add(stats)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    print('{} file(s), {} failed in {:.2f} s'.format(len(jobs), failed, time.perf_counter() - start))
+    if total is not None and len(jobs) > 1:
+        for line in total.report():
+            print('    ' + line)
+    return 1 if failed else 0
+
+
+def _assemble_job(job):
+    return assemble_file(*job)
 
 
 if __name__ == "__main__":
-    file_path = 'test/test.asm'
-    input_text = open_file(file_path)
-    no_error, infos, output_text = assemble(input_text)
-    for info in infos:
-        print(info)
-    if no_error:
-        save_result(output_text, 'test.bin')
+    # cache.py, preprocess.py and link.py import assemble; let them share this
+    # module instead of loading a second copy
+    sys.modules.setdefault('assemble', sys.modules[__name__])
+    sys.exit(main())
@@ -0,0 +1,7 @@
+# Benchmarks for the assembler: synthetic sources of several mixes and sizes
+# (generate.py) and a runner that times pass 1, pass 2 and assemble() and
+# compares them with stored baselines (run.py). Run from the repository root:
+#
+#   python -m bench                       # time and compare with bench/baseline.json
+#   python -m bench --save                # record the current results as the baseline
+#   python -m bench --check               # exit 1 if anything regressed
@@ -0,0 +1,103 @@
+import random
+import string
+
+# Every generator gets the number of lines to produce between .ORIG and .END
+# and a random.Random, so a seed always gives the same source. Apart from the
+# errors mix the programs assemble cleanly and fit below the device registers.
+
+ORIG = 0x0200
+MEMORY = 0xFE00 - ORIG  # words available to a program
+
+Alu = ('ADD R{}, R{}, R{}', 'ADD R{}, R{}, #{}', 'AND R{}, R{}, #{}', 'AND R{}, R{}, R{}', 'NOT R{}, R{}')
+Memory = ('LDR R{}, R{}, #{}', 'STR R{}, R{}, #{}')
+
+
+def alu(rng):
+    template = rng.choice(Alu)
+    return template.format(rng.randrange(8), rng.randrange(8),
+                           rng.randrange(8) if template.endswith('R{}') else rng.randrange(-16, 16))
+
+
+# straight-line code with a label every 16 lines and short branches
+def instructions(lines, rng):
+    source = []
+    for idx in range(lines):
+        label = 'L{}'.format(idx // 16) if idx % 16 == 0 else ''
+        choice = rng.random()
+        if choice < 0.6:
+            text = alu(rng)
+        elif choice < 0.8:
+            text = rng.choice(Memory).format(rng.randrange(8), rng.randrange(8), rng.randrange(-32, 32))
+        elif choice < 0.9:
+            text = 'LD R{}, #{}'.format(rng.randrange(8), rng.randrange(-256, 256))
+        else:
+            target = min(max(idx // 16 + rng.randrange(-8, 9), 0), (lines - 1) // 16)
+            text = '{} L{}'.format(rng.choice(('BRn', 'BRz', 'BRp', 'BRnz', 'BRzp', 'BR')), target)
+        source.append('{:<12}{}'.format(label, text))
+    return source
+
+
+# a label on every line and references up to a thousand lines ahead
+def labels(lines, rng):
+    source = []
+    last = lines - 1
+    for idx in range(lines):
+        choice = rng.random()
+        if choice < 0.3:
+            text = 'LEA R{}, L{}'.format(rng.randrange(8), min(idx + rng.randrange(1, 250), last))
+        elif choice < 0.5:
+            text = 'JSR L{}'.format(min(idx + rng.randrange(1, 1000), last))
+        elif choice < 0.7:
+            text = 'BRnzp L{}'.format(min(idx + rng.randrange(1, 250), last))
+        elif choice < 0.85:
+            text = '.FILL L{}'.format(rng.randrange(lines))
+        else:
+            text = alu(rng)
+        source.append('L{:<11}{}'.format(idx, text))
+    return source
+
+
+# .STRINGZ, .BLKW and .FILL sized to use most of memory
+def data(lines, rng):
+    source = []
+    budget = MEMORY - lines
+    alphabet = string.ascii_letters + string.digits + ' '
+    for idx in range(lines):
+        extra = min(budget, rng.randrange(2 * (MEMORY - lines) // lines + 1))
+        choice = rng.random()
+        if choice < 0.5 and extra:
+            text = '.STRINGZ "{}"'.format(''.join(rng.choice(alphabet) for _ in range(extra)))
+        elif choice < 0.8 and extra:
+            text = '.BLKW #{}'.format(extra + 1)
+        else:
+            extra = 0
+            text = '.FILL x{:04X}'.format(rng.randrange(0x10000))
+        budget -= extra
+        source.append('{:<12}{}'.format('D{}'.format(idx) if idx % 4 == 0 else '', text))
+    return source
+
+
+Bad_lines = ('ADD R1, R2', 'ADD R1, R8, R2', 'LD R1, NOWHERE', 'LDR R1, R2, #32', 'TRAP #300',
+             'MUL R1, R2, R3', '.FILL x10000', '.STRINGZ hi', '1bad ADD R1, R1, #1', 'ADD R1, R2, #-17',
+             'NOT R1, R2, R3', 'BRz #300', 'FOO BAR')
+
+
+# about a third of the lines have an error
+def errors(lines, rng):
+    source = []
+    for idx in range(lines):
+        if rng.random() < 0.35:
+            source.append(rng.choice(Bad_lines))
+        else:
+            source.append(alu(rng))
+    return source
+
+
+Mixes = {'instructions': instructions, 'labels': labels, 'data': data, 'errors': errors}
+
+
+def generate(mix, lines, seed=0):
+    rng = random.Random('{}:{}:{}'.format(mix, lines, seed))
+    body = Mixes[mix](lines, rng)
+    return ['{:<12}.ORIG x{:04X}\n'.format('', ORIG)] + [line + '\n' for line in body] + \
+        ['{:<12}.END\n'.format('')]
@@ -0,0 +1,118 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+from assemble import __version__, assemble, pass1, pass2
+from bench.generate import Mixes, generate
+
+Sizes = (1000, 5000, 20000)
+Baseline_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+
+# the best of repeat runs, in seconds
+def best_time(func, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def peak_memory(func):
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def measure(mix, lines, repeat=5, seed=0):
+    source = generate(mix, lines, seed)
+    error1, instructions, symbol_table = pass1(source)
+    result = {'lines': len(source),
+              'pass1': best_time(lambda: pass1(source), repeat),
+              'pass2': None if error1 else best_time(lambda: pass2(instructions, symbol_table), repeat),
+              'assemble': best_time(lambda: assemble(source), repeat),
+              'peak_kib': peak_memory(lambda: assemble(source)) / 1024}
+    result['lines_per_s'] = result['lines'] / result['assemble']
+    return result
+
+
+def load_baseline(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as baseline_file:
+            return json.load(baseline_file)
+    except (OSError, ValueError):
+        return None
+
+
+def save_baseline(path, results):
+    baseline = {'version': __version__, 'python': platform.python_version(),
+                'machine': platform.machine(), 'date': time.strftime('%Y-%m-%d'),
+                'results': results}
+    with open(path, 'w', encoding='utf-8') as baseline_file:
+        json.dump(baseline, baseline_file, indent=1, sort_keys=True)
+        baseline_file.write('\n')
+
+
+def format_ms(seconds):
+    return '-' if seconds is None else '{:.1f}'.format(seconds * 1000)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m bench', description='Benchmark the LC-3 assembler.')
+    parser.add_argument('-m', '--mix', dest='mixes', action='append', choices=sorted(Mixes),
+                        help='source mix, may be repeated (default: all)')
+    parser.add_argument('-s', '--size', dest='sizes', action='append', type=int,
+                        help='lines per source, may be repeated (default: {})'
+                        .format(', '.join(map(str, Sizes))))
+    parser.add_argument('-r', '--repeat', type=int, default=5, help='runs per measurement, the best counts')
+    parser.add_argument('-b', '--baseline', default=Baseline_path, help='baseline file (default: bench/baseline.json)')
+    parser.add_argument('-t', '--tolerance', type=float, default=0.15,
+                        help='slowdown of assemble() counted as a regression (default: 0.15)')
+    parser.add_argument('--save', action='store_true', help='store the results as the new baseline')
+    parser.add_argument('--check', action='store_true', help='exit with 1 if anything regressed')
+    args = parser.parse_args(argv)
+    baseline = None if args.save else load_baseline(args.baseline)
+    if baseline is not None:
+        print('baseline: {} on python {} ({}), {}'.format(baseline['version'], baseline['python'],
+                                                          baseline['machine'], baseline['date']))
+    print('{:<20}{:>10}{:>10}{:>10}{:>12}{:>12}{:>10}'.format(
+        'benchmark', 'pass1 ms', 'pass2 ms', 'total ms', 'lines/s', 'peak KiB', 'vs base'))
+    results = {}
+    regressions = []
+    for mix in args.mixes or sorted(Mixes):
+        for lines in args.sizes or Sizes:
+            name = '{}/{}'.format(mix, lines)
+            result = results[name] = measure(mix, lines, args.repeat)
+            change = ''
+            if baseline is not None and name in baseline['results']:
+                ratio = result['assemble'] / baseline['results'][name]['assemble']
+                change = '{:+.0%}'.format(ratio - 1)
+                if ratio > 1 + args.tolerance:
+                    regressions.append(name)
+                    change += ' !'
+            print('{:<20}{:>10}{:>10}{:>10}{:>12.0f}{:>12.0f}{:>10}'.format(
+                name, format_ms(result['pass1']), format_ms(result['pass2']), format_ms(result['assemble']),
+                result['lines_per_s'], result['peak_kib'], change))
+    if args.save:
+        # a partial run only replaces the benchmarks it ran
+        previous = load_baseline(args.baseline)
+        if previous is not None:
+            results = dict(previous['results'], **results)
+        save_baseline(args.baseline, results)
+        print('saved baseline to {}'.format(args.baseline))
+    if regressions:
+        print('{} regression(s) over {:.0%}: {}'.format(len(regressions), args.tolerance, ', '.join(regressions)))
+    return 1 if args.check and regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
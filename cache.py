@@ -0,0 +1,147 @@
+import base64
+import hashlib
+import json
+import mmap
+import os
+import sys
+import threading
+from array import array
+
+from assemble import __version__, Token
+from symbols import SymbolTable
+
+
+def default_cache_dir():
+    return os.environ.get('LC3_CACHE_DIR') or \
+        os.path.join(os.path.expanduser('~'), '.cache', 'lc3-assembler')
+
+
+def pack_words(results):
+    words = array('H', results)
+    if sys.byteorder == 'little':
+        words.byteswap()
+    return base64.b64encode(words.tobytes()).decode('ascii')
+
+
+def unpack_words(text):
+    words = array('H')
+    words.frombytes(base64.b64decode(text))
+    if sys.byteorder == 'little':
+        words.byteswap()
+    return words
+
+
+# one BuildCache per directory and process, so the size it keeps carries
+# over from one file to the next
+_shared = {}
+
+
+def shared_cache(directory):
+    cache = _shared.get(directory)
+    if cache is None:
+        cache = _shared[directory] = BuildCache(directory)
+    return cache
+
+
+class BuildCache:
+    def __init__(self, directory=None, max_size=64 * 1024 * 1024):
+        self.directory = directory or default_cache_dir()
+        self.max_size = max_size
+        # bytes in the directory as far as this process knows, so a put only
+        # scans it once the limit is passed; None until the first put
+        self.size = None
+        self.size_lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+
+    # path is part of the key because .INCLUDE names are relative to it.
+    # lines may also be the bytes of the file, e.g. a memory map, which are
+    # hashed as they are
+    def key(self, lines, formats=(), path=None):
+        directory = os.path.dirname(os.path.abspath(path)) if path else ''
+        digest = hashlib.sha256()
+        digest.update('{}\0{}\0{}\0'.format(__version__, ','.join(sorted(formats)), directory)
+                      .encode('utf-8'))
+        if isinstance(lines, (bytes, mmap.mmap)):
+            digest.update(b'\0')
+            digest.update(lines)
+            return digest.hexdigest()
+        for line in lines:
+            digest.update(line.rstrip('\r\n').encode('utf-8'))
+            digest.update(b'\n')
+        return digest.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + '.json')
+
+    def get(self, key):
+        path = self.path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as entry_file:
+                entry = json.load(entry_file)
+            # an entry is stale once a file it included has changed, been
+            # created or been removed
+            for depend, mtime in entry.get('depends', ()):
+                try:
+                    current = os.stat(depend).st_mtime_ns
+                except FileNotFoundError:
+                    current = None
+                if current != mtime:
+                    return None
+            os.utime(path)  # mark as recently used
+        except (OSError, ValueError):
+            return None
+        instructions = [(line_no, LC, [Token(*token) for token in tokens])
+                        for line_no, LC, tokens in entry['instructions']]
+        return (entry['success'], entry['infos'], unpack_words(entry['results']),
+                instructions, SymbolTable(entry['symbol_table'], entry['externals'], entry['globals']))
+
+    def put(self, key, success, infos, results, instructions, symbol_table, depends=()):
+        entry = {'success': success, 'infos': infos, 'results': pack_words(results),
+                 'instructions': instructions, 'symbol_table': symbol_table.to_list(),
+                 'externals': sorted(symbol_table.externals), 'globals': sorted(symbol_table.globals),
+                 'depends': list(depends)}
+        path = self.path(key)
+        temp = '{}.{}.{}.tmp'.format(path, os.getpid(), threading.get_ident())
+        try:
+            with open(temp, 'w', encoding='utf-8') as entry_file:
+                json.dump(entry, entry_file, separators=(',', ':'))
+                written = entry_file.tell()
+            os.replace(temp, path)
+        except OSError:
+            return
+        with self.size_lock:
+            if self.size is not None:
+                # an entry written again is counted twice, which only makes
+                # the next scan come sooner
+                self.size += written
+                if self.size <= self.max_size:
+                    return
+            self.size = self.evict()
+
+    # removes the least recently used entries until the directory is below
+    # three quarters of max_size, so the next scan is some puts away, and
+    # returns the size left
+    def evict(self):
+        entries = []
+        total = 0
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith('.json'):
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total += stat.st_size
+        if total <= self.max_size:
+            return total
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_size * 3 // 4:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+        return total
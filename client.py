@@ -0,0 +1,49 @@
+import getpass
+import json
+import os
+import socket
+import sys
+import tempfile
+
+# Forwards an assemble.py command line to a running server.py, which already
+# has everything imported, so a build only costs starting this small script:
+#
+#   python client.py lab1.asm -f obj       same arguments as assemble.py
+#
+# Without a server (or on a system without Unix sockets) the command is run
+# here by assemble.main() instead.
+
+
+def default_socket_path():
+    return os.environ.get('LC3_SOCKET') or \
+        os.path.join(tempfile.gettempdir(), 'lc3-assembler-{}.sock'.format(getpass.getuser()))
+
+
+# sends one request and returns the reply, see server.py for both
+def request(message, path=None):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        connection.connect(path or default_socket_path())
+        connection.sendall(json.dumps(message).encode('utf-8') + b'\n')
+        with connection.makefile('rb') as reply_file:
+            reply = reply_file.readline()
+    if not reply:
+        raise ConnectionError('the server closed the connection')
+    return json.loads(reply)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    try:
+        reply = request({'argv': argv, 'cwd': os.getcwd()})
+    except (OSError, AttributeError):
+        from assemble import main as assemble_main
+        return assemble_main(argv)
+    if 'error' in reply:
+        print('Server error: {}'.format(reply['error']), file=sys.stderr)
+        return 1
+    sys.stdout.write(reply['output'])
+    return reply['status']
+
+
+if __name__ == '__main__':
+    sys.exit(main())
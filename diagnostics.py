@@ -0,0 +1,82 @@
+from collections import namedtuple
+
+# an error found while assembling; column is where the offending token starts
+# in its line (0 based) or None, and args fill in the message of the code.
+# Nothing is formatted until message() is called
+Diagnostic = namedtuple('Diagnostic', ['code', 'line', 'column', 'args'])
+
+# code -> message template
+Messages = {
+    # lexing and operands
+    'invalid_label': 'Invalid label \'{}\'',
+    'redundant_operand': '\'{}...\' is redundant',
+    'missing_operand': 'Expected more operand(s)',
+    'expected_value': 'Expected 16 bit value, but found \'{}\' instead',
+    'value_range': '{} can not be represented as an unsigned number in 16 bits',
+    'expected_register': 'Expected register operand, but found \'{}\' instead',
+    'bad_register': 'Register {} does not exist',
+    'signed_range': '{} can not be represented as a signed number in {} bits',
+    'expected_pcoffset': 'Expected label or {} bit signed PC offset, but found \'{}\' instead',
+    'expected_imm5_or_reg': 'Expected register or immediate value, but found \'{}\' instead',
+    'expected_offset6': 'Expected 6 bit signed number, but found \'{}\' instead',
+    'trap_range': '{} can not be represented as an 8 bit trap vector',
+    'expected_trapvect8': 'Expected 8 bit non-negative trap vector, but found \'{}\' instead',
+    'expected_string': 'Expected string constant, but found \'{}\' instead',
+    'wide_string': 'String constant \'{}\' has characters beyond 16 bits',
+    # pass 1
+    'memory_overflow': 'Instruction uses memory beyond memory location xFFFF',
+    'expected_orig': 'Expected .ORIG, but found \'{}\' instead',
+    'duplicate_orig': 'Duplicate pseudo_op \'.ORIG\'',
+    'duplicate_label': 'Duplicate label \'{}\' with label on line {}',
+    'missing_opcode': 'Expected opcode or pseudo_op after \'{}\', but found nothing',
+    'unknown_opcode': 'Unrecognized opcode or pseudo_op at \'{}\'',
+    'missing_end': 'Expected \'.END\' at end of file',
+    # pass 2
+    'undefined_label': 'Instruction references undefined label \'{}\'',
+    'label_range': 'Instruction references label \'{}\' that cannot be represented in a {} bit signed PC offset',
+    'external_defined': 'External label \'{}\' is also defined in this file',
+    'global_undefined': 'Global label \'{}\' is not defined in this file',
+    # preprocessor
+    'stray_endm': '\'.ENDM\' without \'.MACRO\'',
+    'missing_endm': 'Expected \'.ENDM\' for \'.MACRO\'',
+    'missing_macro_name': 'Expected macro name after \'.MACRO\'',
+    'expected_parameter': 'Expected parameter name, but found \'{}\' instead',
+    'macro_arguments': 'Macro \'{}\' expects {} argument(s), but found {}',
+    'recursive_macro': 'Macro \'{}\' uses itself',
+    'expected_include': 'Expected file name string after \'.INCLUDE\'',
+    'recursive_include': '\'{}\' includes itself',
+    'include_failed': 'Can not include \'{}\': {}',
+    'bad_equ': 'Expected \'NAME .EQU value\'',
+}
+
+
+def message(diagnostic):
+    return 'Line {}:'.format(diagnostic.line) + Messages[diagnostic.code].format(*diagnostic.args)
+
+
+def report(error, code, line_no, column, *args):
+    error.append(Diagnostic(code, line_no, column, args))
+
+
+class TooManyErrors(Exception):
+    pass
+
+
+# a list of diagnostics that stops the assembly, by raising TooManyErrors,
+# once it holds limit of them; limit=1 fails on the first error
+class Diagnostics(list):
+    def __init__(self, limit=None):
+        list.__init__(self)
+        self.limit = limit
+
+    def append(self, diagnostic):
+        list.append(self, diagnostic)
+        if self.limit is not None and len(self) >= self.limit:
+            raise TooManyErrors()
+
+    def extend(self, diagnostics):
+        for diagnostic in diagnostics:
+            self.append(diagnostic)
+
+    def messages(self):
+        return [message(diagnostic) for diagnostic in self]
@@ -0,0 +1,196 @@
+import argparse
+import os
+import sys
+from array import array
+
+from assemble import Instruction_specs, field
+from symbols import SymbolTable
+
+# operand type -> bits it takes up before shifting
+Operand_bits = {'reg': 0x7, 'imm5|reg': 0x3F, 'offset6': 0x3F,
+                'pcoffset9': 0x1FF, 'pcoffset11': 0x7FF, 'trapvect8': 0xFF}
+
+
+def sext(value, bits):
+    return value - (1 << bits) if value >> (bits - 1) else value
+
+
+# each decoder turns the raw bits of an operand into its source text, or into
+# ('pc', offset) when the text depends on where the word is; None means the
+# bits have no source form and the word has to be written as .FILL
+def decode_reg(bits):
+    return 'R{}'.format(bits)
+
+
+def decode_imm5_or_reg(bits):
+    if bits & 0x20:
+        return '#{}'.format(sext(bits & 0x1F, 5))
+    if bits & 0x18:
+        return None
+    return 'R{}'.format(bits)
+
+
+def decode_offset6(bits):
+    return '#{}'.format(sext(bits, 6))
+
+
+def decode_pcoffset9(bits):
+    return 'pc', sext(bits, 9)
+
+
+def decode_pcoffset11(bits):
+    return 'pc', sext(bits, 11)
+
+
+def decode_trapvect8(bits):
+    return 'x{:02X}'.format(bits)
+
+
+Operand_decoders = {'reg': decode_reg, 'imm5|reg': decode_imm5_or_reg, 'offset6': decode_offset6,
+                    'pcoffset9': decode_pcoffset9, 'pcoffset11': decode_pcoffset11,
+                    'trapvect8': decode_trapvect8}
+
+
+def build_decode_table():
+    entries = []
+    for mnemonic, (base, signature) in Instruction_specs.items():
+        operand_mask = 0
+        for kind, shift in signature:
+            operand_mask |= Operand_bits[kind] << shift
+        fields = tuple((Operand_decoders[kind], shift, Operand_bits[kind]) for kind, shift in signature)
+        entries.append((0xFFFF & ~operand_mask, base, mnemonic, fields))
+    # the most specific pattern wins, so RET comes before JMP and HALT before
+    # TRAP; of two equal patterns (BR, BRNZP) the longer name is kept
+    entries.sort(key=lambda entry: (-bin(entry[0]).count('1'), -len(entry[2])))
+    table = {}
+    seen = set()
+    for mask, match, mnemonic, fields in entries:
+        if (mask, match) not in seen:
+            seen.add((mask, match))
+            table.setdefault(match >> 12, []).append((mask, match, mnemonic, fields))
+    return table
+
+
+# opcode (top 4 bits) -> [(mask, match, mnemonic, ((decoder, shift, bits), ...))]
+Decode_table = build_decode_table()
+
+
+# (mnemonic, operands) for an instruction word, or None if it is not one
+def decode(word):
+    for mask, match, mnemonic, fields in Decode_table.get(word >> 12, ()):
+        if word & mask == match:
+            operands = []
+            for decoder, shift, bits in fields:
+                operand = decoder((word >> shift) & bits)
+                if operand is None:
+                    return None
+                operands.append(operand)
+            return mnemonic, operands
+    return None
+
+
+# source lines for an image (the origin followed by its words); references
+# to an address with a label in symbol_table are written as that label
+def disassemble(results, symbol_table=None):
+    orig = results[0]
+    words = results[1:]
+    end = orig + len(words)
+    labels = {}
+    if symbol_table is not None:
+        for loc, name in symbol_table.in_range(orig, end):
+            labels.setdefault(loc, name)
+    # the same word always decodes the same way, only pc offsets differ
+    decoded = {word: decode(word) for word in set(words)}
+    lines = ['{:<16}.ORIG x{:04X}'.format('', orig)]
+    for loc, word in enumerate(words, orig):
+        instruction = decoded[word]
+        if instruction is None:
+            text = '.FILL x{:04X}'.format(word)
+        else:
+            mnemonic, operands = instruction
+            texts = []
+            for operand in operands:
+                if isinstance(operand, tuple):
+                    target = field(loc + 1 + operand[1], 16)
+                    operand = labels.get(target, '#{}'.format(operand[1]))
+                texts.append(operand)
+            text = '{:<6}{}'.format(mnemonic, ', '.join(texts)).rstrip()
+        # a label of 16 characters or more still needs a space before the opcode
+        lines.append('{:<15} {}'.format(labels.get(loc, ''), text))
+    lines.append('{:<15} .END'.format(''))
+    return lines
+
+
+def read_obj(path):
+    words = array('H')
+    with open(path, 'rb') as obj_file:
+        words.frombytes(obj_file.read())
+    if sys.byteorder == 'little':
+        words.byteswap()
+    return words
+
+
+def read_bin(path):
+    with open(path, 'r', encoding='utf-8') as bin_file:
+        return array('H', (int(line, 2) for line in bin_file if line.strip()))
+
+
+def read_hex(path):
+    with open(path, 'r', encoding='utf-8') as hex_file:
+        return array('H', (int(line, 16) for line in hex_file if line.strip()))
+
+
+Image_readers = {'.obj': read_obj, '.bin': read_bin, '.hex': read_hex}
+
+
+def read_image(path):
+    return Image_readers[os.path.splitext(path)[1].lower()](path)
+
+
+# reads a .sym file as written by assemble.save_sym; definition lines are not
+# recorded there and are left as 0. A line that is not a name and an address
+# raises ValueError
+def read_sym(path):
+    symbol_table = SymbolTable()
+    with open(path, 'r', encoding='utf-8') as sym_file:
+        for line_no, line in enumerate(sym_file, 1):
+            if line.startswith('//\t'):
+                fields = line[3:].split()
+                try:
+                    name, loc = fields
+                    symbol_table.add(name, int(loc, 16), 0)
+                except ValueError:
+                    raise ValueError('Line {}:Expected a label and an address, but found \'{}\' instead'
+                                     .format(line_no, line[3:].strip())) from None
+    return symbol_table
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Disassemble an LC-3 image back into source.')
+    parser.add_argument('image', help='.obj, .bin or .hex image')
+    parser.add_argument('-s', '--symbols', help='.sym file with labels (default: the one next to the image)')
+    parser.add_argument('-o', '--output', help='write the source here (default: stdout)')
+    args = parser.parse_args(argv)
+    if os.path.splitext(args.image)[1].lower() not in Image_readers:
+        parser.error('unknown image format: {}'.format(args.image))
+    results = read_image(args.image)
+    if not results:
+        parser.error('empty image: {}'.format(args.image))
+    sym_path = args.symbols or os.path.splitext(args.image)[0] + '.sym'
+    symbol_table = None
+    if args.symbols or os.path.exists(sym_path):
+        try:
+            symbol_table = read_sym(sym_path)
+        except ValueError as e:
+            parser.error('bad symbol file {}: {}'.format(sym_path, e))
+    text = ''.join(line + '\n' for line in disassemble(results, symbol_table))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8', newline='\r\n') as asm_file:
+            asm_file.write(text)
+    else:
+        sys.stdout.write(text)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
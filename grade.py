@@ -0,0 +1,110 @@
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+from assemble import assemble, open_file
+from simulate import Simulator
+
+# A manifest is a JSON file of the form
+#
+#   {"limit": 1000000,
+#    "programs": [{"source": "lab1.asm",
+#                  "cases": [{"name": "empty", "input": "", "output": "0\n"},
+#                            {"input": "ab", "output": "ba", "limit": 5000}]}]}
+#
+# Sources are relative to the manifest. A case passes when the program halts
+# within its instruction limit and prints exactly the expected output.
+
+
+def assemble_program(path):
+    start = time.perf_counter()
+    try:
+        success, infos, results = assemble(open_file(path), path=path)
+    except (IOError, UnicodeDecodeError) as e:
+        success, infos, results = False, ['Can not read {}: {}'.format(path, e)], []
+    return success, [] if success else infos, results, time.perf_counter() - start
+
+
+def run_case(task):
+    program, case, results, input_text, expected, limit = task
+    simulator = Simulator(input_text)
+    simulator.load(results)
+    start = time.perf_counter()
+    status = simulator.run(limit)
+    elapsed = time.perf_counter() - start
+    output = simulator.output_text()
+    report = {'case': case, 'passed': status == 'halt' and output == expected,
+              'status': status, 'instructions': simulator.steps, 'time': elapsed}
+    if not report['passed']:
+        report['output'] = output
+    return program, report
+
+
+def grade(manifest, base_dir='', jobs=None, limit=1000000):
+    limit = manifest.get('limit', limit)
+    programs = manifest['programs']
+    paths = [os.path.join(base_dir, program['source']) for program in programs]
+    pool = multiprocessing.Pool(jobs)
+    try:
+        assembled = pool.map(assemble_program, paths)
+        reports = []
+        tasks = []
+        for idx, (program, (success, errors, results, elapsed)) in enumerate(zip(programs, assembled)):
+            cases = program.get('cases', [])
+            reports.append({'source': program['source'], 'assembled': success, 'errors': errors,
+                            'assemble_time': elapsed,
+                            'cases': [{'case': case.get('name', str(case_no)), 'passed': False,
+                                       'status': 'unassembled', 'instructions': 0, 'time': 0}
+                                      for case_no, case in enumerate(cases)]})
+            if not success:
+                continue
+            for case_no, case in enumerate(cases):
+                tasks.append(((idx, case_no), case.get('name', str(case_no)), results,
+                              case.get('input', ''), case.get('output', ''), case.get('limit', limit)))
+        for (idx, case_no), report in pool.imap_unordered(run_case, tasks, chunksize=4):
+            reports[idx]['cases'][case_no] = report
+    finally:
+        pool.close()
+        pool.join()
+    cases = [case for report in reports for case in report['cases']]
+    summary = {'programs': len(reports),
+               'assembled': sum(report['assembled'] for report in reports),
+               'cases': len(cases),
+               'passed': sum(case['passed'] for case in cases),
+               'instructions': sum(case['instructions'] for case in cases)}
+    return {'summary': summary, 'programs': reports}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Assemble LC-3 programs and run them against test cases.')
+    parser.add_argument('manifest', help='JSON manifest of programs and their cases')
+    parser.add_argument('-o', '--output', help='write the JSON report here (default: stdout)')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1,
+                        help='number of worker processes (default: number of CPUs)')
+    parser.add_argument('-l', '--limit', type=int, default=1000000,
+                        help='default instruction limit per case (default: 1000000)')
+    args = parser.parse_args(argv)
+    with open(args.manifest, 'r', encoding='utf-8') as manifest_file:
+        manifest = json.load(manifest_file)
+    start = time.perf_counter()
+    report = grade(manifest, os.path.dirname(args.manifest), args.jobs, args.limit)
+    report['summary']['time'] = time.perf_counter() - start
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as report_file:
+            json.dump(report, report_file, indent=1)
+    else:
+        json.dump(report, sys.stdout, indent=1)
+        print()
+    summary = report['summary']
+    print('{} of {} case(s) passed, {} of {} program(s) assembled in {:.2f} s'
+          .format(summary['passed'], summary['cases'], summary['assembled'],
+                  summary['programs'], summary['time']), file=sys.stderr)
+    return 0 if summary['passed'] == summary['cases'] and \
+        summary['assembled'] == summary['programs'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,10 +1,94 @@
 import tkinter as tk
 from tkinter import filedialog as fd
 from tkinter import messagebox as mb
-from assemble import assemble, open_file, save_result
-import time
+from tkinter import font as tkfont
+from array import array
+from assemble import open_file, save_result, bin_text
+from cache import BuildCache
+from diagnostics import message
+from lint import LineChecker
+from session import AssembleSession
+import threading
+import queue
 import os
 
+# token kind -> color in the editor; labels keep the default color
+Token_colors = {'op': 'blue', 'pseudo': 'purple', 'reg': 'dark green', 'num': 'dark orange',
+                'string': 'brown', 'bad': 'red', 'comment': 'gray'}
+Highlight_tags = tuple(Token_colors) + ('error',)
+Check_delay = 200  # ms after the last key press
+
+
+# shows an image a screenful at a time: only the rows in view are put in the
+# Text widgets, with the address of each word in a gutter beside them, so a
+# full 64K word image costs no more to show or scroll than a small one
+class ImageView(tk.Frame):
+    def __init__(self, master, font):
+        super().__init__(master)
+        self.results = array('H')
+        self.top = 0
+        self.rows = 24
+        self.linespace = tkfont.Font(font=font).metrics('linespace')
+        self.scrollx = tk.Scrollbar(self, orient='horizontal')
+        self.scrolly = tk.Scrollbar(self, command=self.yview)
+        self.scrollx.pack(side='bottom', fill='x')
+        self.scrolly.pack(side='right', fill='y')
+        self.gutter = tk.Text(self, font=font, width=6, wrap='none', takefocus=0,
+                              background='#f0f0f0', foreground='gray')
+        self.gutter.pack(side='left', fill='y')
+        self.words = tk.Text(self, font=font, wrap='none', xscrollcommand=self.scrollx.set)
+        self.words.pack(fill='both')
+        self.scrollx.config(command=self.words.xview)
+        for widget in (self.gutter, self.words):
+            widget.config(state=tk.DISABLED)
+            widget.bind('<MouseWheel>', self.wheel)
+            widget.bind('<Button-4>', self.wheel)
+            widget.bind('<Button-5>', self.wheel)
+        self.words.bind('<Configure>', self.resize)
+
+    def show(self, results):
+        self.results = results
+        self.top = 0
+        self.render()
+
+    def address(self, idx):
+        if idx == 0:
+            return '.ORIG'
+        return 'x{:04X}'.format((self.results[0] + idx - 1) & 0xFFFF)
+
+    def render(self):
+        stop = min(self.top + self.rows, len(self.results))
+        rows = range(self.top, stop)
+        for widget, text in ((self.gutter, '\n'.join(map(self.address, rows))),
+                             (self.words, bin_text(self.results[self.top:stop]))):
+            widget.config(state=tk.NORMAL)
+            widget.delete(1.0, 'end')
+            widget.insert('insert', text)
+            widget.config(state=tk.DISABLED)
+        total = len(self.results) or 1
+        self.scrolly.set(self.top / total, (stop if self.results else 1) / total)
+
+    # the scrollbar command: ('moveto', fraction) or ('scroll', n, 'units'/'pages')
+    def yview(self, *args):
+        if args[0] == 'moveto':
+            top = int(float(args[1]) * len(self.results))
+        else:
+            top = self.top + int(args[1]) * (self.rows if args[2] == 'pages' else 1)
+        top = max(0, min(top, len(self.results) - self.rows))
+        if top != self.top:
+            self.top = top
+            self.render()
+
+    def wheel(self, event):
+        self.yview('scroll', -3 if event.num == 4 or event.delta > 0 else 3, 'units')
+        return 'break'
+
+    def resize(self, event):
+        rows = max(1, event.height // self.linespace)
+        if rows != self.rows:
+            self.rows = rows
+            self.render()
+
 
 class Application(tk.Frame):
     def __init__(self, master=None):
@@ -15,9 +99,24 @@ class Application(tk.Frame):
         self.maintitle = 'LC-3 Assembler'
         self.font = ('Courier New', 10)
         self.file_saved = True
+        try:
+            self.session = AssembleSession(BuildCache())
+        except OSError:
+            self.session = AssembleSession()
+        self.results = None
+        self.checker = LineChecker()
+        self.check_job = None
+        self.highlight_job = None
+        self.assembled = {}  # line number -> diagnostics of the last assembly
+        self.job = None
+        self.job_text = None  # the buffer the running job assembles
+        self.saved_text = None  # the buffer as last opened or saved
+        self.jobs = queue.Queue()
+        self.done = queue.Queue()
+        self.worker = threading.Thread(target=self.assemble_worker, daemon=True)
+        self.worker.start()
         self.create_widgets()
         self.new()
-        self.always_run()
 
     def create_widgets(self):
         self.create_frame()
@@ -55,22 +154,17 @@ class Application(tk.Frame):
         self.inputx.pack(side='bottom', fill='x')
         self.inputy.pack(side='right', fill='y')
         self.inputbox = tk.Text(self.inputframe, font=self.font, undo=True, wrap='none',
-                                xscrollcommand=self.inputx.set, yscrollcommand=self.inputy.set)
+                                xscrollcommand=self.inputx.set, yscrollcommand=self.scroll_input)
         self.inputbox.pack(fill='both')
+        for kind, color in Token_colors.items():
+            self.inputbox.tag_configure(kind, foreground=color)
+        self.inputbox.tag_configure('error', foreground='red', underline=True)
         self.inputx.config(command=self.inputbox.xview)
         self.inputy.config(command=self.inputbox.yview)
 
         # create output box
-        self.outputx = tk.Scrollbar(self.outputframe, orient='horizontal')
-        self.outputy = tk.Scrollbar(self.outputframe)
-        self.outputx.pack(side='bottom', fill='x')
-        self.outputy.pack(side='right', fill='y')
-        self.outputbox = tk.Text(self.outputframe, font=self.font,
-                                 xscrollcommand=self.outputx.set, yscrollcommand=self.outputy.set)
-        self.outputbox.pack(fill='both')
-        self.outputbox.config(state=tk.DISABLED)
-        self.outputx.config(command=self.outputbox.xview)
-        self.outputy.config(command=self.outputbox.yview)
+        self.outputview = ImageView(self.outputframe, self.font)
+        self.outputview.pack(fill='both')
 
         # create info box
         self.infox = tk.Scrollbar(self.infoframe, orient='horizontal', bd=1)
@@ -110,6 +204,10 @@ class Application(tk.Frame):
                                    relief='sunken', height=1, width=10)
         self.line_label.pack(side='right', padx=2)
         self.line.set('Line 1')
+        self.problem = tk.StringVar()
+        self.problem_label = tk.Label(self.footer, textvariable=self.problem, font=self.font,
+                                      fg='red', anchor='w')
+        self.problem_label.pack(side='left', fill='x', padx=2)
 
     def create_menu(self):
         self.menu = tk.Menu(self.master)
@@ -144,33 +242,47 @@ class Application(tk.Frame):
         self.master.bind('<Control-s>', self._save)
         self.master.bind('<Control-q>', self._quit)
         self.master.bind('<Control-Return>', self._assemble)
+        # the Text class binding would insert a newline before the toplevel
+        # one runs, so the editor handles the key itself
+        self.inputbox.bind('<Control-Return>', self._assemble)
+        self.inputbox.bind('<<Modified>>', self._modified)
+        self.inputbox.bind('<KeyRelease>', self._showline)
+        self.inputbox.bind('<ButtonRelease-1>', self._showline)
 
     def new(self):
         if not self.save_changed():
             return
-        self.inputbox.delete(1.0, 'end')
+        self.cancel_assemble()
         self.filepath = ''
         self.filename = 'Untitled'
-        self.input_text = self.inputbox.get(1.0, 'end')
-        self.file_saved = True
+        self.inputbox.delete(1.0, 'end')
+        self.inputbox.edit_modified(False)
+        self.results = None
+        self.set_file_saved(True)
+        self.schedule_check()
+        self.showline()
 
     def open(self):
         temp = fd.askopenfilename(filetypes=[('.asm', '.asm')])
         if temp:
             if not self.save_changed():
                 return
+            self.cancel_assemble()
             self.filepath = temp
             self.filename = os.path.basename(self.filepath)
+            self.results = None
             self.infobox.config(state=tk.NORMAL)
             self.infobox.delete(1.0, 'end')
             self.infobox.insert('insert', 'Opening {}...\n'.format(self.filepath))
             input_text = open_file(self.filepath)
             self.inputbox.delete(1.0, 'end')
             self.inputbox.insert('insert', ''.join(input_text))
-            self.input_text = self.inputbox.get(1.0, 'end')
+            self.inputbox.edit_modified(False)
             self.infobox.insert('insert', '- Done')
             self.infobox.config(state=tk.DISABLED)
-            self.file_saved = True
+            self.set_file_saved(True)
+            self.schedule_check()
+            self.showline()
 
     def save_file(self, save_as=False):
         if save_as:
@@ -179,16 +291,16 @@ class Application(tk.Frame):
             temp = self.filepath
         if temp:
             self.filepath = temp
-            self.input_text = self.inputbox.get(1.0, 'end')
+            input_text = self.inputbox.get(1.0, 'end')
             self.infobox.config(state=tk.NORMAL)
             self.infobox.delete(1.0, 'end')
             self.infobox.insert('insert', 'Saving to {}...\n'.format(self.filepath))
             try:
                 with open(self.filepath, 'w', encoding='utf-8') as asmfile:
-                    asmfile.write(self.input_text)
+                    asmfile.write(input_text)
                 self.filename = os.path.basename(self.filepath)
                 self.infobox.insert('insert', '- Done')
-                self.file_saved = True
+                self.set_file_saved(True)
             except IOError:
                 self.infobox.insert('insert', '- Failed')
             self.infobox.config(state=tk.DISABLED)
@@ -205,30 +317,137 @@ class Application(tk.Frame):
     def save_as(self):
         return self.save_file(save_as=True)
 
-    def save_result(self):
-        self.outputbox.config(state=tk.NORMAL)
-        output_text = self.outputbox.get(1.0, 'end').strip().split('\n')
-        save_result(output_text, ''.join(self.filepath.split('.')[:-1]) + '.bin')
-        self.outputbox.config(state=tk.DISABLED)
+    # runs on the worker thread, the only one that touches self.session
+    def assemble_worker(self):
+        saved = None
+        while True:
+            job, lines, path = self.jobs.get()
+            if job.is_set():
+                continue
+            result = self.session.update(lines, job, path)
+            if result is None:
+                continue
+            success, assemble_info, results = result
+            bin_path = os.path.splitext(path)[0] + '.bin' if path else None
+            if success and self.session.symbol_table.externals:
+                assemble_info.append('Uses .EXTERNAL labels, not writing .bin; assemble with -f rel and link')
+                bin_path = None
+            if success and bin_path and saved != (bin_path, results):
+                try:
+                    save_result(results, bin_path)
+                    saved = (bin_path, results)
+                except IOError:
+                    assemble_info.append('Can not write {}'.format(bin_path))
+            self.done.put((job, success, assemble_info, results, list(self.session.diagnostics)))
 
     def assemble(self):
         input_text = self.inputbox.get(1.0, 'end')[:-1]
         if input_text:
             self.save()
+            self.cancel_assemble()
             self.infobox.config(state=tk.NORMAL)
-            self.outputbox.config(state=tk.NORMAL)
-            self.outputbox.delete(1.0, 'end')
             self.infobox.delete(1.0, 'end')
-            time.sleep(0.01)
-            input_text = input_text.split('\n')
-            success, assemble_info, results = assemble(input_text)
-            assemble_info[0] = 'Assembling {}...'.format(self.filepath)
-            self.infobox.insert('insert', '\n'.join(assemble_info))
-            if success:
-                self.outputbox.insert('insert', '\n'.join(results) + '\n')
-                self.save_result()
+            self.infobox.insert('insert', 'Assembling {}...'.format(self.filepath))
             self.infobox.config(state=tk.DISABLED)
-            self.outputbox.config(state=tk.DISABLED)
+            self.job = threading.Event()
+            self.job_text = input_text
+            self.jobs.put((self.job, input_text.split('\n'), self.filepath or None))
+            self.after(20, self.poll_assemble)
+
+    def cancel_assemble(self):
+        if self.job is not None:
+            self.job.set()
+            self.job = None
+
+    def poll_assemble(self):
+        while True:
+            try:
+                job, success, assemble_info, results, diagnostics = self.done.get_nowait()
+            except queue.Empty:
+                break
+            if job is self.job:
+                self.job = None
+                self.show_result(success, assemble_info, results)
+                self.show_diagnostics(diagnostics)
+        if self.job is not None:
+            self.after(20, self.poll_assemble)
+
+    def show_result(self, success, assemble_info, results):
+        self.infobox.config(state=tk.NORMAL)
+        self.infobox.delete(1.0, 'end')
+        assemble_info[0] = 'Assembling {}...'.format(self.filepath)
+        self.infobox.insert('insert', '\n'.join(assemble_info))
+        if not success:
+            self.outputview.show(array('H'))
+            self.results = None
+        elif results != self.results:
+            self.outputview.show(results)
+            self.results = results
+        self.infobox.config(state=tk.DISABLED)
+
+    # lines of included files have a preprocess.SourceLine number and are not
+    # in the editor
+    def show_diagnostics(self, diagnostics):
+        self.assembled = {}
+        for diagnostic in diagnostics:
+            if type(diagnostic.line) is int:
+                self.assembled.setdefault(diagnostic.line, []).append(diagnostic)
+        self.highlight()
+        self.showline()
+
+    def line_diagnostics(self, line_no):
+        diagnostics = self.checker.diagnostics(line_no)
+        for diagnostic in self.assembled.get(line_no, ()):
+            if diagnostic not in diagnostics:
+                diagnostics.append(diagnostic)
+        return diagnostics
+
+    # lints the buffer Check_delay ms after the last edit; only the changed
+    # lines are lexed again
+    def schedule_check(self):
+        if self.check_job is not None:
+            self.after_cancel(self.check_job)
+        self.check_job = self.after(Check_delay, self.check)
+
+    def check(self):
+        self.check_job = None
+        self.checker.update(self.inputbox.get(1.0, 'end')[:-1].split('\n'), self.filepath or None)
+        self.highlight()
+        self.showline()
+
+    def scroll_input(self, first, last):
+        self.inputy.set(first, last)
+        if self.check_job is None and self.highlight_job is None:
+            self.highlight_job = self.after_idle(self.highlight)
+
+    def visible_lines(self):
+        first = int(self.inputbox.index('@0,0').split('.')[0])
+        last = int(self.inputbox.index('@0,{}'.format(self.inputbox.winfo_height())).split('.')[0])
+        return first, min(last, len(self.checker.entries))
+
+    # tags only the lines on screen, again whenever the view moves
+    def highlight(self):
+        if self.highlight_job is not None:
+            self.after_cancel(self.highlight_job)
+            self.highlight_job = None
+        first, last = self.visible_lines()
+        for tag in Highlight_tags:
+            self.inputbox.tag_remove(tag, '{}.0'.format(first), '{}.end'.format(last))
+        for line_no in range(first, last + 1):
+            entry = self.checker.entries[line_no - 1]
+            for token in entry.tokens:
+                if token.kind in Token_colors:
+                    self.inputbox.tag_add(token.kind, '{}.{}'.format(line_no, token.column),
+                                          '{}.{}'.format(line_no, token.column + len(token.text)))
+            if entry.comment is not None:
+                self.inputbox.tag_add('comment', '{}.{}'.format(line_no, entry.comment), '{}.end'.format(line_no))
+            for diagnostic in self.line_diagnostics(line_no):
+                start, end = '{}.0'.format(line_no), '{}.end'.format(line_no)
+                for token in entry.tokens:
+                    if token.column == diagnostic.column:
+                        start = '{}.{}'.format(line_no, token.column)
+                        end = '{}.{}'.format(line_no, token.column + len(token.text))
+                self.inputbox.tag_add('error', start, end)
 
     def help(self):
         message = 'Welcome! This is a LC-3 assembler.\n\n' \
@@ -273,20 +492,17 @@ class Application(tk.Frame):
     def set_title(self):
         self.master.title(self.maintitle+' - '+self.filename+('' if self.file_saved else ' *'))
 
-    def check_file_saved(self):
-        if self.file_saved:
-            input_text = self.inputbox.get(1.0, 'end')
-            if input_text != self.input_text:
-                self.file_saved = False
+    def set_file_saved(self, file_saved):
+        self.file_saved = file_saved
+        if file_saved:
+            self.saved_text = self.inputbox.get(1.0, 'end')
+        self.set_title()
 
     def showline(self):
-        self.line.set('Line ' + self.inputbox.index('insert').split('.')[0])
-
-    def always_run(self):
-        self.check_file_saved()
-        self.set_title()
-        self.showline()
-        self.after(100, self.always_run)
+        line_no = self.inputbox.index('insert').split('.')[0]
+        self.line.set('Line ' + line_no)
+        diagnostics = self.line_diagnostics(int(line_no))
+        self.problem.set(message(diagnostics[0]) if diagnostics else '')
 
     def _new(self, event):
         self.new()
@@ -302,6 +518,29 @@ class Application(tk.Frame):
 
     def _assemble(self, event):
         self.assemble()
+        return 'break'
+
+    # <<Modified>> only fires when the flag flips, so it is cleared again to
+    # hear about the next edit; events with the flag already clear are our own.
+    # The event is queued, so it may come after the edit was already saved
+    # and sent to assemble; only a buffer that differs from those counts
+    def _modified(self, event):
+        if self.inputbox.edit_modified():
+            # the buffer is only fetched while there is something to compare
+            # it with, not for every key typed into an unsaved file
+            text = None
+            if self.job is not None or self.file_saved:
+                text = self.inputbox.get(1.0, 'end')
+            if self.job is not None and text[:-1] != self.job_text:
+                self.cancel_assemble()
+            self.assembled = {}
+            self.schedule_check()
+            if self.file_saved and text != self.saved_text:
+                self.set_file_saved(False)
+            self.inputbox.edit_modified(False)
+
+    def _showline(self, event):
+        self.showline()
 
 
 if __name__ == '__main__':
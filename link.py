@@ -0,0 +1,143 @@
+import argparse
+import json
+import os
+import sys
+from array import array
+
+from assemble import Instruction_specs, field, is_label, save_outputs
+from cache import pack_words, unpack_words
+from symbols import SymbolTable
+
+# A relocatable object (.rel) is a JSON file of the form
+#
+#   {"orig": 12288, "words": <base64 of the big-endian words>,
+#    "symbols": [[name, loc, line], ...], "globals": [name, ...],
+#    "externals": [name, ...], "relocations": [[offset, bits, name], ...]}
+#
+# offset is the index of a word in the module. A 16 bit relocation is an
+# absolute address: of the external label name, or with name null of a label
+# of the module itself, which moves with the module. 9 and 11 bit relocations
+# are the PC offset of an instruction to the external label name.
+
+
+def relocations(instructions, symbol_table):
+    orig = field(instructions[0][2][1].value, 16)
+    entries = []
+    for line_no, LC, instruction in instructions:
+        head = instruction[0]
+        if head.kind == 'pseudo':
+            if head.value == '.FILL' and is_label(instruction[1]):
+                name = instruction[1].text
+                entries.append([LC - orig, 16, name if name in symbol_table.externals else None])
+            continue
+        for operand, (kind, _) in zip(instruction[1:], Instruction_specs[head.value][1]):
+            if kind.startswith('pcoffset') and is_label(operand) and operand.text in symbol_table.externals:
+                entries.append([LC - orig, int(kind[len('pcoffset'):]), operand.text])
+    return entries
+
+
+def save_rel(results, instructions, symbol_table, path):
+    module = {'orig': results[0], 'words': pack_words(results[1:]),
+              'symbols': symbol_table.to_list(),
+              'globals': sorted(symbol_table.globals), 'externals': sorted(symbol_table.externals),
+              'relocations': relocations(instructions, symbol_table)}
+    with open(path, 'w', encoding='utf-8') as rel_file:
+        json.dump(module, rel_file, separators=(',', ':'))
+
+
+def read_rel(path):
+    with open(path, 'r', encoding='utf-8') as rel_file:
+        module = json.load(rel_file)
+    module['words'] = unpack_words(module['words'])
+    return module
+
+
+# modules is a list of (name, module) as read by read_rel(); they are placed
+# one after another from origin, by default the .ORIG of the first one.
+# Returns the errors, the linked image and a symbol table of the globals
+def link(modules, origin=None):
+    error = []
+    if origin is None:
+        origin = modules[0][1]['orig']
+    bases = []
+    addresses = {}  # global label -> (address, module name)
+    base = origin
+    for name, module in modules:
+        bases.append(base)
+        symbol_table = SymbolTable(module['symbols'])
+        for label in module['globals']:
+            if label in addresses:
+                error.append('{}:Global label \'{}\' is also defined in {}'
+                             .format(name, label, addresses[label][1]))
+            else:
+                addresses[label] = (symbol_table.loc(label) - module['orig'] + base, name)
+        base += len(module['words'])
+    if base > 0x10000:
+        error.append('Linked image uses memory beyond memory location xFFFF')
+        return error, array('H'), SymbolTable()
+    results = array('H', [origin])
+    for (name, module), base in zip(modules, bases):
+        words = array('H', module['words'])
+        for offset, bits, label in module['relocations']:
+            if label is None:
+                words[offset] = field(words[offset] + base - module['orig'], 16)
+            elif label not in addresses:
+                error.append('{}:Undefined external label \'{}\''.format(name, label))
+            elif bits == 16:
+                words[offset] = addresses[label][0]
+            else:
+                pcoffset = addresses[label][0] - (base + offset + 1)
+                if pcoffset > 2 ** (bits - 1) - 1 or pcoffset < -2 ** (bits - 1):
+                    error.append('{}:Label \'{}\' at x{:04X} cannot be represented in a {} bit '
+                                 'signed PC offset from x{:04X}'
+                                 .format(name, label, addresses[label][0], bits, base + offset))
+                else:
+                    words[offset] |= field(pcoffset, bits)
+        results.extend(words)
+    # the globals, then the labels of each module at their linked address; a
+    # local label also defined by an earlier module or as a global keeps the
+    # first address
+    symbol_table = SymbolTable((label, address, 0) for label, (address, _) in sorted(addresses.items()))
+    for (name, module), base in zip(modules, bases):
+        for label, loc, line in module['symbols']:
+            if label not in symbol_table:
+                symbol_table.add(label, loc - module['orig'] + base, line)
+    return error, results, symbol_table
+
+
+def parse_address(text):
+    if text[:1] in 'xX':
+        return int(text[1:], 16)
+    return int(text, 0)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Link relocatable LC-3 objects into one image.')
+    parser.add_argument('modules', nargs='+', help='.rel files, placed in this order')
+    parser.add_argument('-o', '--output', help='output path without extension (default: the first module)')
+    parser.add_argument('-O', '--origin', type=parse_address,
+                        help='load address, e.g. x3000 (default: the .ORIG of the first module)')
+    parser.add_argument('-f', '--format', dest='formats', action='append', choices=('bin', 'obj', 'hex', 'sym'),
+                        help='output format, may be repeated (default: bin)')
+    args = parser.parse_args(argv)
+    modules = []
+    for path in args.modules:
+        try:
+            modules.append((path, read_rel(path)))
+        except (OSError, ValueError, KeyError) as e:
+            print('Can not read {}: {}'.format(path, e))
+            return 1
+    error, results, symbol_table = link(modules, args.origin)
+    for info in error:
+        print(info)
+    if error:
+        print('Linking failed - {} error(s)'.format(len(error)))
+        return 1
+    base = args.output or os.path.splitext(args.modules[0])[0]
+    save_outputs(base, results, [], symbol_table, tuple(args.formats) if args.formats else ('bin',))
+    print('Linked {} module(s) into {} word(s) at x{:04X}'.format(len(modules), len(results) - 1, results[0]))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
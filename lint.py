@@ -0,0 +1,132 @@
+import os
+from collections import namedtuple
+
+from assemble import Pseudo_ops, is_label, parse_op, tokenize, valid_label
+from diagnostics import report
+from preprocess import Directives, directive, has_directives, load_include
+from symbols import SymbolTable
+
+# Checks the lines of an editor buffer one by one, for what pass 1 can tell
+# from a single line: label names, opcodes and operands. The result of a line
+# only depends on its text, so it is cached by text and an edit only re-lexes
+# the lines that changed. Errors that need the whole program (.ORIG/.END,
+# duplicate or undefined labels) are left to assembling it.
+
+# tokens as tokenize() gives them, where the comment starts (or None) and the
+# diagnostics of the line with line number 0
+Checked = namedtuple('Checked', ['tokens', 'comment', 'diagnostics'])
+
+
+def check_tokens(tokens, error):
+    leader = tokens[0]
+    if is_label(leader):
+        valid_label(leader, 0, error)
+        instruction = tokens[1:]
+    else:
+        instruction = tokens
+    if not instruction:
+        report(error, 'missing_opcode', 0, leader.column, leader.text)
+        return
+    head = instruction[0]
+    if head.kind == 'op':
+        parse_op(head, instruction[1:], 0, error)
+    elif head.kind != 'pseudo':
+        report(error, 'unknown_opcode', 0, head.column, head.text)
+    elif Pseudo_ops[head.value][0] is not None:
+        Pseudo_ops[head.value][0](instruction[1:], [-1], 0, error, SymbolTable())
+
+
+def check_line(line):
+    tokens = tokenize(line)
+    end = tokens[-1].column + len(tokens[-1].text) if tokens else 0
+    comment = line.find(';', end)
+    error = []
+    if tokens and directive(tokens, 0) not in Directives and directive(tokens, 1) != '.EQU':
+        check_tokens(tokens, error)
+    return Checked(tokens, comment if comment >= 0 else None, error)
+
+
+# macro and .EQU names defined by parsed lines and the files they include
+def defined_names(parsed_lines, directory, including):
+    names = set()
+    for tokens in parsed_lines:
+        if not tokens:
+            continue
+        name = directive(tokens, 0)
+        if name == '.MACRO' and len(tokens) > 1:
+            names.add(tokens[1].text)
+        elif directive(tokens, 1) == '.EQU':
+            names.add(tokens[0].text)
+        elif name == '.INCLUDE' and len(tokens) == 2 and tokens[1].kind == 'string' and tokens[1].value:
+            path = os.path.abspath(os.path.join(directory, tokens[1].value))
+            if path in including:
+                continue
+            including.add(path)
+            try:
+                names |= defined_names(load_include(path)[1], os.path.dirname(path), including)
+            except (OSError, UnicodeDecodeError):
+                pass
+    return names
+
+
+class LineChecker:
+    def __init__(self):
+        self.checked = {}  # line text -> Checked
+        self.lines = []
+        self.entries = []
+        self.quiet = frozenset()  # indexes of lines the preprocessor changes
+
+    def check(self, line):
+        entry = self.checked.get(line)
+        if entry is None:
+            entry = self.checked[line] = check_line(line)
+        return entry
+
+    # re-checks the lines that differ from the previous call and returns the
+    # indexes (start, stop) of the new lines that did; path is the file being
+    # edited, which .INCLUDE names are relative to
+    def update(self, lines, path=None):
+        lines = list(lines)
+        old = self.lines
+        limit = min(len(old), len(lines))
+        prefix = 0
+        while prefix < limit and old[prefix] == lines[prefix]:
+            prefix += 1
+        suffix = 0
+        while suffix < limit - prefix and old[-1 - suffix] == lines[-1 - suffix]:
+            suffix += 1
+        self.entries[prefix:len(old) - suffix] = [self.check(line) for line in lines[prefix:len(lines) - suffix]]
+        self.lines = lines
+        if len(self.checked) > 2 * len(lines) + 1024:
+            self.checked = dict(zip(lines, self.entries))
+        parsed_lines = [entry.tokens for entry in self.entries]
+        if has_directives(parsed_lines):
+            self.quiet = self.preprocessed(parsed_lines, path)
+        else:
+            self.quiet = frozenset()
+        return prefix, len(lines) - suffix
+
+    # lines of macro bodies and lines using macro or .EQU names are only
+    # known after expanding, so they are not checked on their own
+    def preprocessed(self, parsed_lines, path):
+        including = {os.path.abspath(path)} if path else set()
+        names = defined_names(parsed_lines, os.path.dirname(path) if path else '', including)
+        quiet = set()
+        body = False
+        for idx, tokens in enumerate(parsed_lines):
+            if not tokens:
+                continue
+            name = directive(tokens, 0)
+            if name == '.MACRO':
+                body = True
+            elif name == '.ENDM':
+                body = False
+            elif body or any(token.kind == 'label' and token.text in names for token in tokens):
+                quiet.add(idx)
+        return frozenset(quiet)
+
+    # the diagnostics of line line_no, counted from 1
+    def diagnostics(self, line_no):
+        if line_no < 1 or line_no > len(self.entries) or line_no - 1 in self.quiet:
+            return []
+        return [diagnostic._replace(line=line_no) for diagnostic in self.entries[line_no - 1].diagnostics]
@@ -0,0 +1,264 @@
+import json
+import os
+import sys
+from urllib.parse import unquote, urlparse
+from urllib.request import pathname2url, url2pathname
+
+from assemble import is_label
+from diagnostics import Messages
+from session import AssembleSession
+
+# A language server for editors such as VS Code and Neovim, over stdio:
+#
+#   python lsp.py
+#
+# It keeps an AssembleSession per open document, so an edit only re-lexes the
+# changed lines and re-encodes the instructions it affects, and answers
+# diagnostics, go to definition, find references and hover (the address and
+# the encoded words of a line) from the state of the last update.
+
+Error_severity = 1
+Incremental_sync = 2
+
+
+def read_message(stream):
+    length = None
+    while True:
+        header = stream.readline()
+        if not header:
+            return None
+        header = header.strip()
+        if not header:
+            break
+        name, _, value = header.partition(b':')
+        if name.strip().lower() == b'content-length':
+            length = int(value)
+    if length is None:
+        return None
+    return json.loads(stream.read(length))
+
+
+def write_message(stream, message):
+    body = json.dumps(message, separators=(',', ':')).encode('utf-8')
+    stream.write('Content-Length: {}\r\n\r\n'.format(len(body)).encode('ascii') + body)
+    stream.flush()
+
+
+def uri_to_path(uri):
+    parsed = urlparse(uri)
+    if parsed.scheme != 'file':
+        return None
+    return url2pathname(unquote(parsed.path))
+
+
+def path_to_uri(path):
+    return 'file://' + pathname2url(os.path.abspath(path))
+
+
+def position(line, character):
+    return {'line': line, 'character': character}
+
+
+def line_range(line, start, end):
+    return {'start': position(line, start), 'end': position(line, end)}
+
+
+class Document:
+    def __init__(self, uri, text):
+        self.uri = uri
+        self.path = uri_to_path(uri)
+        self.lines = text.split('\n')
+        self.session = AssembleSession()
+        self.located = None  # line number -> (LC, instruction), built on demand
+
+    def line(self, idx):
+        return self.lines[idx] if idx < len(self.lines) else ''
+
+    def change(self, change):
+        if 'range' not in change:
+            self.lines = change['text'].split('\n')
+            return
+        start, end = change['range']['start'], change['range']['end']
+        text = self.line(start['line'])[:start['character']] + change['text'] + \
+            self.line(end['line'])[end['character']:]
+        self.lines[start['line']:end['line'] + 1] = text.split('\n')
+
+    def update(self):
+        self.session.update(self.lines, None, self.path)
+        self.located = None
+
+    def tokens(self, idx):
+        if idx >= len(self.session.parsed):
+            return []
+        return self.session.parsed[idx] or []
+
+    def token_at(self, idx, character):
+        for token in self.tokens(idx):
+            if token.column <= character <= token.column + len(token.text):
+                return token
+        return None
+
+    # lines of included files have a preprocess.SourceLine number and are
+    # not in this document
+    def instruction_at(self, line_no):
+        if self.located is None:
+            self.located = {}
+            for instruction_line, LC, instruction in self.session.instructions:
+                if type(instruction_line) is int:
+                    self.located.setdefault(instruction_line, (LC, instruction))
+        return self.located.get(line_no)
+
+    def words(self, LC, count):
+        results = self.session.results
+        if not results:
+            return []
+        start = LC - results[0] + 1
+        return results[start:start + count]
+
+    def diagnostic(self, diagnostic):
+        idx = diagnostic.line - 1
+        start, end = 0, len(self.line(idx))
+        for token in self.tokens(idx):
+            if token.column == diagnostic.column:
+                start, end = token.column, token.column + len(token.text)
+        return {'range': line_range(idx, start, end), 'severity': Error_severity, 'source': 'lc3',
+                'code': diagnostic.code, 'message': Messages[diagnostic.code].format(*diagnostic.args)}
+
+    def diagnostics(self):
+        return [self.diagnostic(diagnostic) for diagnostic in self.session.diagnostics
+                if type(diagnostic.line) is int]
+
+
+class LanguageServer:
+    def __init__(self, output):
+        self.output = output
+        self.documents = {}
+        self.stopped = False
+        self.handlers = {'initialize': self.initialize,
+                         'shutdown': self.shutdown,
+                         'textDocument/didOpen': self.did_open,
+                         'textDocument/didChange': self.did_change,
+                         'textDocument/didClose': self.did_close,
+                         'textDocument/definition': self.definition,
+                         'textDocument/references': self.references,
+                         'textDocument/hover': self.hover}
+
+    def send(self, message):
+        message['jsonrpc'] = '2.0'
+        write_message(self.output, message)
+
+    def publish(self, document):
+        self.send({'method': 'textDocument/publishDiagnostics',
+                   'params': {'uri': document.uri, 'diagnostics': document.diagnostics()}})
+
+    # answers requests; notifications without a handler are ignored
+    def handle(self, message):
+        method = message.get('method')
+        handler = self.handlers.get(method)
+        if 'id' not in message:
+            if handler is not None:
+                handler(message.get('params'))
+            return
+        if handler is None:
+            self.send({'id': message['id'], 'error': {'code': -32601, 'message': 'Unknown method {}'.format(method)}})
+            return
+        try:
+            result = handler(message.get('params'))
+        except (KeyError, IndexError, TypeError, ValueError) as e:
+            self.send({'id': message['id'], 'error': {'code': -32602, 'message': str(e)}})
+            return
+        self.send({'id': message['id'], 'result': result})
+
+    def initialize(self, params):
+        return {'capabilities': {'textDocumentSync': Incremental_sync, 'definitionProvider': True,
+                                 'referencesProvider': True, 'hoverProvider': True},
+                'serverInfo': {'name': 'lc3-assembler'}}
+
+    def shutdown(self, params):
+        self.stopped = True
+        return None
+
+    def did_open(self, params):
+        item = params['textDocument']
+        document = self.documents[item['uri']] = Document(item['uri'], item['text'])
+        document.update()
+        self.publish(document)
+
+    def did_change(self, params):
+        document = self.documents[params['textDocument']['uri']]
+        for change in params['contentChanges']:
+            document.change(change)
+        document.update()
+        self.publish(document)
+
+    def did_close(self, params):
+        document = self.documents.pop(params['textDocument']['uri'], None)
+        if document is not None:
+            self.send({'method': 'textDocument/publishDiagnostics',
+                       'params': {'uri': document.uri, 'diagnostics': []}})
+
+    # the document, the line index and the label token under the cursor
+    def label_at(self, params):
+        document = self.documents[params['textDocument']['uri']]
+        idx, character = params['position']['line'], params['position']['character']
+        token = document.token_at(idx, character)
+        if token is None or not is_label(token):
+            return document, idx, None
+        return document, idx, token
+
+    def definition(self, params):
+        document, _, token = self.label_at(params)
+        if token is None or token.text not in document.session.symbol_table:
+            return None
+        line_no = document.session.symbol_table.line(token.text)
+        if type(line_no) is not int:
+            return {'uri': path_to_uri(line_no.path), 'range': line_range(int(line_no) - 1, 0, 0)}
+        tokens = document.tokens(line_no - 1)
+        if not tokens:
+            # the document changed since the label was defined
+            return {'uri': document.uri, 'range': line_range(line_no - 1, 0, 0)}
+        column = tokens[0].column
+        return {'uri': document.uri, 'range': line_range(line_no - 1, column, column + len(token.text))}
+
+    def references(self, params):
+        document, _, token = self.label_at(params)
+        if token is None:
+            return []
+        declaration = params.get('context', {}).get('includeDeclaration', True)
+        locations = []
+        for idx, tokens in enumerate(document.session.parsed):
+            for column, reference in enumerate(tokens or ()):
+                if reference.text == token.text and is_label(reference) and (declaration or column > 0):
+                    locations.append({'uri': document.uri,
+                                      'range': line_range(idx, reference.column,
+                                                          reference.column + len(reference.text))})
+        return locations
+
+    def hover(self, params):
+        document, idx, token = self.label_at(params)
+        symbol_table = document.session.symbol_table
+        if token is not None and token.text in symbol_table:
+            return {'contents': {'kind': 'markdown',
+                                 'value': '`{}` = x{:04X}'.format(token.text, symbol_table.loc(token.text))}}
+        located = document.instruction_at(idx + 1)
+        if located is None:
+            return None
+        LC, instruction = located
+        text = 'x{:04X}'.format(LC)
+        if instruction[0].kind == 'op' or instruction[0].value == '.FILL':
+            for word in document.words(LC, 1):
+                text += ': `{:016b}` (x{:04X})'.format(word, word)
+        return {'contents': {'kind': 'markdown', 'value': text}}
+
+
+def main():
+    server = LanguageServer(sys.stdout.buffer)
+    while True:
+        message = read_message(sys.stdin.buffer)
+        if message is None or message.get('method') == 'exit':
+            return 0 if server.stopped else 1
+        server.handle(message)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,185 @@
+import os
+
+from assemble import parse_line
+from diagnostics import report
+
+# Expands, over lines already tokenized by parse_line():
+#
+#   .INCLUDE "stack.asm"         the lines of another file, relative to this one
+#   NAME .EQU x4000              later operands NAME are replaced by x4000
+#   .MACRO PUSH reg              a macro; in its body the parameter names are
+#       ADD R6, R6, #-1          replaced by the arguments of each use,
+#       STR reg, R6, #0          e.g. 'PUSH R1' or 'LOOP PUSH R1'
+#   .ENDM
+#
+# Directive lines become empty lines, so a source without .INCLUDE or macro
+# uses keeps its line numbers. Lines of an included file are numbered within
+# that file and lines of a macro use get the number of the line using it.
+
+Directives = ('.INCLUDE', '.MACRO', '.ENDM')
+
+# absolute path -> (modification time, parsed lines)
+Included = {}
+
+
+# a line number in an included file, shown as 'stack.asm:12' in messages
+class SourceLine(int):
+    def __new__(cls, line_no, path):
+        self = int.__new__(cls, line_no)
+        self.path = path
+        return self
+
+    def __format__(self, spec):
+        if spec:
+            return int.__format__(self, spec)
+        return '{}:{}'.format(os.path.basename(self.path), int(self))
+
+    def __str__(self):
+        return format(self)
+
+    def __getnewargs__(self):
+        return int(self), self.path
+
+
+def load_include(path):
+    mtime = os.stat(path).st_mtime_ns
+    entry = Included.get(path)
+    if entry is None or entry[0] != mtime:
+        with open(path, 'r', encoding='utf-8') as include_file:
+            entry = Included[path] = (mtime, [parse_line(line) for line in include_file])
+    return entry
+
+
+def directive(tokens, idx):
+    if len(tokens) > idx and tokens[idx].kind == 'bad':
+        return tokens[idx].value.upper()
+    return None
+
+
+def has_directives(parsed_lines):
+    return any(tokens is not None and (directive(tokens, 0) in Directives or directive(tokens, 1) == '.EQU')
+               for tokens in parsed_lines)
+
+
+class Expansion:
+    def __init__(self, error, depends):
+        self.error = error
+        self.depends = depends
+        self.macros = {}  # name -> (parameters, [(line_no, tokens)])
+        self.equs = {}  # name -> token
+        self.including = []
+        self.expanding = []
+
+    # replaces label tokens found in names, only in the operands unless
+    # everywhere is set
+    def substitute(self, tokens, names, everywhere=False):
+        head = -1 if everywhere else (0 if tokens[0].kind in ('op', 'pseudo') else 1)
+        return tokens[:head + 1] + [names.get(token.text, token) if token.kind == 'label' else token
+                                    for token in tokens[head + 1:]]
+
+    # yields (line number, tokens) as it goes, so pass 1 can stop early
+    def expand(self, numbered_lines, directory):
+        for line_no, tokens in numbered_lines:
+            if tokens is None:
+                yield line_no, None
+                continue
+            name = directive(tokens, 0)
+            if name == '.MACRO':
+                yield line_no, None
+                yield from self.define_macro(line_no, tokens, numbered_lines)
+            elif name == '.ENDM':
+                report(self.error, 'stray_endm', line_no, tokens[0].column)
+                yield line_no, None
+            elif name == '.INCLUDE':
+                yield line_no, None
+                yield from self.include(line_no, tokens, directory)
+            elif directive(tokens, 1) == '.EQU':
+                yield line_no, None
+                self.define_equ(line_no, tokens)
+            elif tokens[0].kind == 'label' and tokens[0].text in self.macros:
+                yield from self.use_macro(line_no, None, tokens[0].text, tokens[1:], directory)
+            elif len(tokens) > 1 and tokens[1].kind == 'label' and tokens[1].text in self.macros:
+                yield from self.use_macro(line_no, tokens[0], tokens[1].text, tokens[2:], directory)
+            else:
+                yield line_no, self.substitute(tokens, self.equs) if self.equs else tokens
+
+    def define_macro(self, line_no, tokens, numbered_lines):
+        body = []
+        for body_line_no, body_tokens in numbered_lines:
+            yield body_line_no, None
+            if body_tokens is not None and directive(body_tokens, 0) == '.ENDM':
+                break
+            if body_tokens is not None:
+                body.append((body_line_no, body_tokens))
+        else:
+            report(self.error, 'missing_endm', line_no, tokens[0].column)
+        if len(tokens) < 2 or tokens[1].kind != 'label':
+            report(self.error, 'missing_macro_name', line_no, tokens[0].column)
+            return
+        parameters = tokens[2:]
+        for parameter in parameters:
+            if parameter.kind != 'label':
+                report(self.error, 'expected_parameter', line_no, parameter.column, parameter.text)
+                return
+        self.macros[tokens[1].text] = (tuple(parameter.text for parameter in parameters), body)
+
+    def use_macro(self, line_no, label, name, arguments, directory):
+        parameters, body = self.macros[name]
+        if len(arguments) != len(parameters):
+            report(self.error, 'macro_arguments', line_no, None, name, len(parameters), len(arguments))
+            return
+        if name in self.expanding:
+            report(self.error, 'recursive_macro', line_no, None, name)
+            return
+        names = dict(zip(parameters, arguments))
+        expanded = [(line_no, self.substitute(tokens, names, True)) for _, tokens in body]
+        if label is not None:
+            expanded[:1] = [(line_no, [label] + (expanded[0][1] if expanded else []))]
+        self.expanding.append(name)
+        yield from self.expand(iter(expanded), directory)
+        self.expanding.pop()
+
+    def include(self, line_no, tokens, directory):
+        if len(tokens) != 2 or tokens[1].kind != 'string' or not tokens[1].value:
+            report(self.error, 'expected_include', line_no, tokens[0].column)
+            return
+        path = os.path.abspath(os.path.join(directory, tokens[1].value))
+        if path in self.including:
+            report(self.error, 'recursive_include', line_no, tokens[1].column, tokens[1].value)
+            return
+        try:
+            mtime, parsed_lines = load_include(path)
+        except (OSError, UnicodeDecodeError) as e:
+            report(self.error, 'include_failed', line_no, tokens[1].column, tokens[1].value, e)
+            if self.depends is not None:
+                # so the failure is not cached past the file being created or fixed
+                try:
+                    self.depends.append((path, os.stat(path).st_mtime_ns))
+                except OSError:
+                    self.depends.append((path, None))
+            return
+        if self.depends is not None:
+            self.depends.append((path, mtime))
+        self.including.append(path)
+        yield from self.expand(((SourceLine(idx + 1, path), tokens) for idx, tokens in enumerate(parsed_lines)),
+                               os.path.dirname(path))
+        self.including.pop()
+
+    def define_equ(self, line_no, tokens):
+        if len(tokens) != 3 or tokens[0].kind != 'label' or tokens[2].kind not in ('num', 'reg', 'label'):
+            report(self.error, 'bad_equ', line_no, tokens[0].column)
+            return
+        self.equs[tokens[0].text] = self.equs.get(tokens[2].text, tokens[2])
+
+
+# returns an iterator of (line number, tokens) over the expanded lines;
+# parsed_lines may be a lazy iterator too, then it is expanded as it is read.
+# Included files are recorded in depends as (path, modification time), with
+# None for one that does not exist
+def preprocess(parsed_lines, path=None, error=None, depends=None):
+    if isinstance(parsed_lines, list) and not has_directives(parsed_lines):
+        return enumerate(parsed_lines, 1)
+    expansion = Expansion([] if error is None else error, depends)
+    if path is not None:
+        expansion.including.append(os.path.abspath(path))
+    return expansion.expand(iter(enumerate(parsed_lines, 1)), os.path.dirname(path) if path else '')
@@ -0,0 +1,157 @@
+import argparse
+import io
+import json
+import os
+import socketserver
+import sys
+import threading
+from contextlib import nullcontext, redirect_stderr, redirect_stdout
+
+from assemble import assemble_image, main as assemble_main, open_file
+from cache import BuildCache, default_cache_dir, pack_words
+from client import default_socket_path
+from diagnostics import Diagnostics, message
+
+# A long running assembler, so editors and the grader do not start Python for
+# every small job. It reads one JSON request per line and answers each with
+# one JSON line, over a Unix socket or with --stdio over stdin/stdout:
+#
+#   {"id": 1, "source": ".ORIG x3000\n...", "path": "lab1.asm"}
+#       assembles the text; path, if given, is where .INCLUDE looks
+#   {"id": 2, "path": "lab1.asm", "cwd": "/home/me/labs"}
+#       reads and assembles a file, relative to cwd
+#       both may have "max_errors": N and answer
+#       {"id": 1, "success": true, "orig": 12288, "words": <base64 of the
+#        big-endian words after .ORIG>, "symbols": [[name, loc, line], ...],
+#        "diagnostics": [{"code", "line", "column", "args", "message"}, ...],
+#        "infos": [...]}
+#   {"id": 3, "argv": ["lab1.asm", "-f", "obj"], "cwd": "/home/me/labs"}
+#       runs the assemble.py command line (see client.py) and answers
+#       {"id": 3, "status": 0, "output": "..."}
+#
+# A request that can not be carried out is answered {"id": ..., "error": "..."}.
+
+
+def diagnostic_record(diagnostic):
+    return {'code': diagnostic.code, 'line': diagnostic.line, 'column': diagnostic.column,
+            'args': diagnostic.args, 'message': message(diagnostic)}
+
+
+class AssembleService:
+    def __init__(self, cache=None):
+        self.cache = cache
+        # command lines change directory and capture sys.stdout, so they
+        # run one at a time
+        self.command_lock = threading.Lock()
+        self.cwd = os.getcwd()
+
+    def assemble(self, request):
+        path = request.get('path')
+        if path is not None:
+            # made absolute here, as a command may have changed directory
+            path = os.path.join(self.cwd, request.get('cwd') or '', path)
+        if 'source' in request:
+            lines = request['source'].splitlines(True)
+        elif path is not None:
+            lines = open_file(path)
+        else:
+            raise ValueError('expected "source", "path" or "argv"')
+        diagnostics = Diagnostics(request.get('max_errors'))
+        # without a path .INCLUDE names are relative to the current directory,
+        # which is only the server's own while no command runs
+        with self.command_lock if path is None else nullcontext():
+            success, infos, results, _, symbol_table = assemble_image(lines, self.cache, (), path, None, diagnostics)
+            if not success and not diagnostics:
+                # a cached failure only keeps its messages
+                success, infos, results, _, symbol_table = assemble_image(lines, None, (), path, None, diagnostics)
+        return {'success': success, 'orig': results[0] if results else None, 'words': pack_words(results[1:]),
+                'symbols': symbol_table.to_list(), 'diagnostics': list(map(diagnostic_record, diagnostics)),
+                'infos': infos}
+
+    def command(self, request):
+        output = io.StringIO()
+        with self.command_lock, redirect_stdout(output), redirect_stderr(output):
+            os.chdir(os.path.join(self.cwd, request.get('cwd') or ''))
+            try:
+                # one process per build is what the server is there to avoid
+                status = assemble_main(['-j', '1'] + list(request['argv']))
+            except SystemExit as e:
+                status = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+            finally:
+                os.chdir(self.cwd)
+        return {'status': status, 'output': output.getvalue()}
+
+    def handle(self, request):
+        try:
+            reply = self.command(request) if 'argv' in request else self.assemble(request)
+        except (OSError, UnicodeDecodeError, ValueError, TypeError, KeyError) as e:
+            reply = {'error': str(e)}
+        reply['id'] = request.get('id')
+        return reply
+
+    def reply(self, line):
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError('expected a JSON object')
+        except ValueError as e:
+            return {'id': None, 'error': 'Bad request: {}'.format(e)}
+        return self.handle(request)
+
+
+def encode_reply(reply):
+    return json.dumps(reply, default=str, separators=(',', ':')).encode('utf-8') + b'\n'
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            if line.strip():
+                self.wfile.write(encode_reply(self.server.service.reply(line)))
+                self.wfile.flush()
+
+
+class AssembleServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path, service):
+        self.service = service
+        if os.path.exists(path):
+            os.remove(path)  # left over from a server that did not stop cleanly
+        super().__init__(path, RequestHandler)
+
+
+def serve_stdio(service):
+    for line in sys.stdin.buffer:
+        if line.strip():
+            sys.stdout.buffer.write(encode_reply(service.reply(line)))
+            sys.stdout.buffer.flush()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve LC-3 assemble requests, see the top of server.py.')
+    parser.add_argument('-s', '--socket', help='Unix socket path (default: $LC3_SOCKET or one in the temp directory)')
+    parser.add_argument('--stdio', action='store_true', help='read requests from stdin and answer on stdout')
+    parser.add_argument('--cache-dir',
+                        help='build cache directory (default: $LC3_CACHE_DIR or ~/.cache/lc3-assembler)')
+    parser.add_argument('--no-cache', action='store_true', help='always assemble from scratch')
+    args = parser.parse_args(argv)
+    service = AssembleService(None if args.no_cache else BuildCache(args.cache_dir or default_cache_dir()))
+    if args.stdio:
+        serve_stdio(service)
+        return 0
+    path = args.socket or default_socket_path()
+    with AssembleServer(path, service) as server:
+        print('Listening on {}'.format(path))
+        sys.stdout.flush()
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            os.remove(path)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
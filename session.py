@@ -0,0 +1,97 @@
+from array import array
+
+from assemble import parse_line, pass1_tokens, convert, is_label
+from diagnostics import message
+from symbols import SymbolTable
+
+
+# keeps the state of the last assembly of an editor buffer: update() re-lexes
+# only the lines that differ from the previous call and re-encodes only the
+# instructions whose text, location or referenced labels changed
+class AssembleSession:
+    def __init__(self, cache=None):
+        self.cache = cache
+        self.lines = []
+        self.parsed = []
+        self.encoded = {}
+        self.instructions = []
+        self.symbol_table = SymbolTable()
+        self.results = array('H')
+        self.diagnostics = []
+
+    def relex(self, lines):
+        old = self.lines
+        limit = min(len(old), len(lines))
+        prefix = 0
+        while prefix < limit and old[prefix] == lines[prefix]:
+            prefix += 1
+        suffix = 0
+        while suffix < limit - prefix and old[-1 - suffix] == lines[-1 - suffix]:
+            suffix += 1
+        self.parsed[prefix:len(old) - suffix] = [parse_line(line) for line in
+                                                 lines[prefix:len(lines) - suffix]]
+        self.lines = lines
+
+    def encode(self, error):
+        encoded = {}
+        results = array('H')
+        for line_no, LC, instruction in self.instructions:
+            labels = tuple(operand.text for operand in instruction[1:] if is_label(operand))
+            key = tuple(instruction)
+            if labels:
+                key = (key, LC)
+            # an .EXTERNAL label has no location either, but encodes differently
+            # from an undefined one
+            refers = tuple((self.symbol_table.get(l), l in self.symbol_table.externals) for l in labels)
+            entry = self.encoded.get(key)
+            if entry is None or entry[0] != refers or (entry[3] and entry[1] != line_no):
+                errors = []
+                words = array('H', convert(instruction, LC, line_no, errors, self.symbol_table))
+                entry = (refers, line_no, words, errors)
+            encoded[key] = entry
+            results.extend(entry[2])
+            error.extend(entry[3])
+        self.encoded = encoded
+        return results
+
+    # a set cancel event (threading.Event) abandons the run and returns None
+    # path is the file being edited, which .INCLUDE names are relative to
+    def update(self, lines, cancel=None, path=None):
+        lines = list(lines)
+        # the build cache only helps before there is any state to reuse
+        key = None
+        depends = []
+        if self.cache is not None and not self.lines:
+            key = self.cache.key(lines, (), path)
+            entry = self.cache.get(key)
+            # the cache keeps messages, not diagnostics, so a failed build is
+            # assembled again for the editor to mark its errors
+            if entry is not None and entry[0]:
+                success, assemble_infos, self.results, self.instructions, self.symbol_table = entry
+                self.diagnostics = []
+                return success, assemble_infos, self.results
+        self.relex(lines)
+        if cancel is not None and cancel.is_set():
+            return None
+        success = False
+        results = array('H')
+        assemble_infos = ["Assembling...", "Starting Pass 1..."]
+        error1, self.instructions, self.symbol_table = pass1_tokens(self.parsed, path, depends)
+        self.diagnostics = error1
+        assemble_infos.extend(map(message, error1))
+        assemble_infos.append('Pass 1 - {} error(s)'.format(len(error1)))
+        if cancel is not None and cancel.is_set():
+            return None
+        if not error1:
+            assemble_infos.append("Starting Pass 2...")
+            error2 = []
+            results = self.encode(error2)
+            self.diagnostics = error2
+            assemble_infos.extend(map(message, error2))
+            assemble_infos.append('Pass 2 - {} error(s)'.format(len(error2)))
+            if not error2:
+                success = True
+        self.results = results
+        if key is not None:
+            self.cache.put(key, success, assemble_infos, results, [], self.symbol_table, depends)
+        return success, assemble_infos, results
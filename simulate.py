@@ -0,0 +1,274 @@
+import argparse
+import sys
+from array import array
+
+from assemble import assemble, open_file
+
+# decoded operations; ADD and AND are split on the immediate bit so the
+# execute loop never has to look at it again
+(ADD_REG, ADD_IMM, AND_REG, AND_IMM, NOT, BR, JMP, JSR, JSRR, LD, LDI, LDR,
+ LEA, ST, STI, STR, TRAP, RTI, RESERVED) = range(19)
+
+KBSR, KBDR, DSR, DDR, MCR = 0xFE00, 0xFE02, 0xFE04, 0xFE06, 0xFFFE
+
+
+def sext(value, bits):
+    value &= (1 << bits) - 1
+    return value - (1 << bits) if value >> (bits - 1) else value
+
+
+def decode(word):
+    opcode = word >> 12
+    dr = (word >> 9) & 7
+    sr1 = (word >> 6) & 7
+    if opcode == 0x1 or opcode == 0x5:
+        if word & 0x20:
+            return (ADD_IMM if opcode == 0x1 else AND_IMM), dr, sr1, sext(word, 5)
+        return (ADD_REG if opcode == 0x1 else AND_REG), dr, sr1, word & 7
+    if opcode == 0x0:
+        return BR, dr, sext(word, 9)
+    if opcode in (0x2, 0xA, 0xE, 0x3, 0xB):
+        return {0x2: LD, 0xA: LDI, 0xE: LEA, 0x3: ST, 0xB: STI}[opcode], dr, sext(word, 9)
+    if opcode == 0x6 or opcode == 0x7:
+        return (LDR if opcode == 0x6 else STR), dr, sr1, sext(word, 6)
+    if opcode == 0x9:
+        return NOT, dr, sr1
+    if opcode == 0xC:
+        return JMP, sr1
+    if opcode == 0x4:
+        if word & 0x800:
+            return JSR, sext(word, 11)
+        return JSRR, sr1
+    if opcode == 0xF:
+        return TRAP, word & 0xFF
+    if opcode == 0x8:
+        return RTI,
+    return RESERVED,
+
+
+class Simulator:
+    def __init__(self, input_text=''):
+        self.memory = array('H', bytes(2 * 65536))
+        self.decoded = [None] * 65536
+        self.reg = [0] * 8
+        self.pc = 0x3000
+        self.cc = 2
+        self.steps = 0
+        self.status = None
+        self.input_text = input_text
+        self.input_pos = 0
+        self.output = []
+
+    # results is an assembled image: the origin followed by its words
+    def load(self, results):
+        orig = results[0]
+        words = array('H', results[1:])
+        end = min(orig + len(words), 65536)
+        self.memory[orig:end] = words[:end - orig]
+        self.decoded[orig:end] = [None] * (end - orig)
+        self.pc = orig
+
+    def load_obj(self, path):
+        words = array('H')
+        with open(path, 'rb') as obj_file:
+            words.frombytes(obj_file.read())
+        if sys.byteorder == 'little':
+            words.byteswap()
+        self.load(words)
+
+    def write(self, address, value):
+        if address >= 0xFE00:
+            if address == DDR:
+                self.output.append(chr(value & 0xFF))
+            elif address == MCR and not value & 0x8000:
+                self.status = 'halt'
+            return
+        self.memory[address] = value
+        self.decoded[address] = None
+
+    def read(self, address):
+        if address >= 0xFE00:
+            if address == KBSR:
+                return 0x8000 if self.input_pos < len(self.input_text) else 0
+            if address == KBDR:
+                return self.getc()
+            if address == DSR:
+                return 0x8000
+            if address == MCR:
+                return 0 if self.status == 'halt' else 0x8000
+        return self.memory[address]
+
+    def getc(self):
+        if self.input_pos >= len(self.input_text):
+            self.status = 'input'
+            return 0
+        char = self.input_text[self.input_pos]
+        self.input_pos += 1
+        return ord(char) & 0xFF
+
+    def trap(self, vector):
+        reg = self.reg
+        if vector == 0x20:  # GETC
+            reg[0] = self.getc()
+        elif vector == 0x21:  # OUT
+            self.output.append(chr(reg[0] & 0xFF))
+        elif vector == 0x22:  # PUTS
+            address = reg[0]
+            memory = self.memory
+            while memory[address]:
+                self.output.append(chr(memory[address] & 0xFF))
+                address = (address + 1) & 0xFFFF
+        elif vector == 0x23:  # IN
+            self.output.append('\nInput a character> ')
+            reg[0] = self.getc()
+            if self.status != 'input':
+                self.output.append(chr(reg[0]) + '\n')
+        elif vector == 0x24:  # PUTSP
+            address = reg[0]
+            memory = self.memory
+            while memory[address]:
+                word = memory[address]
+                self.output.append(chr(word & 0xFF))
+                if word >> 8:
+                    self.output.append(chr(word >> 8))
+                address = (address + 1) & 0xFFFF
+        elif vector == 0x25:  # HALT
+            self.status = 'halt'
+        else:
+            self.status = 'trap'
+
+    # runs until HALT, an error, or limit instructions; returns the status:
+    # 'halt', 'limit', 'input' (input exhausted), 'trap' (unknown vector),
+    # 'rti' or 'reserved'
+    def run(self, limit=None):
+        memory = self.memory
+        decoded = self.decoded
+        reg = self.reg
+        read = self.read
+        write = self.write
+        pc = self.pc
+        cc = self.cc
+        steps = 0
+        limit = -1 if limit is None else limit
+        self.status = None
+        while True:
+            if steps == limit:
+                self.status = 'limit'
+                break
+            d = decoded[pc]
+            if d is None:
+                d = decoded[pc] = decode(memory[pc])
+            pc = (pc + 1) & 0xFFFF
+            steps += 1
+            op = d[0]
+            if op == ADD_IMM:
+                value = reg[d[1]] = (reg[d[2]] + d[3]) & 0xFFFF
+            elif op == BR:
+                if d[1] & cc:
+                    pc = (pc + d[2]) & 0xFFFF
+                continue
+            elif op == LD:
+                address = (pc + d[2]) & 0xFFFF
+                value = reg[d[1]] = memory[address] if address < 0xFE00 else read(address)
+            elif op == LDR:
+                address = (reg[d[2]] + d[3]) & 0xFFFF
+                value = reg[d[1]] = memory[address] if address < 0xFE00 else read(address)
+            elif op == ADD_REG:
+                value = reg[d[1]] = (reg[d[2]] + reg[d[3]]) & 0xFFFF
+            elif op == AND_IMM:
+                value = reg[d[1]] = reg[d[2]] & d[3] & 0xFFFF
+            elif op == AND_REG:
+                value = reg[d[1]] = reg[d[2]] & reg[d[3]]
+            elif op == STR:
+                address = (reg[d[2]] + d[3]) & 0xFFFF
+                if address < 0xFE00:
+                    memory[address] = reg[d[1]]
+                    decoded[address] = None
+                else:
+                    write(address, reg[d[1]])
+                    if self.status is not None:
+                        break
+                continue
+            elif op == NOT:
+                value = reg[d[1]] = ~reg[d[2]] & 0xFFFF
+            elif op == ST:
+                address = (pc + d[2]) & 0xFFFF
+                if address < 0xFE00:
+                    memory[address] = reg[d[1]]
+                    decoded[address] = None
+                else:
+                    write(address, reg[d[1]])
+                    if self.status is not None:
+                        break
+                continue
+            elif op == LEA:
+                reg[d[1]] = (pc + d[2]) & 0xFFFF
+                continue
+            elif op == JMP:
+                pc = reg[d[1]]
+                continue
+            elif op == JSR:
+                reg[7] = pc
+                pc = (pc + d[1]) & 0xFFFF
+                continue
+            elif op == JSRR:
+                target = reg[d[1]]
+                reg[7] = pc
+                pc = target
+                continue
+            elif op == LDI:
+                address = read((pc + d[2]) & 0xFFFF)
+                value = reg[d[1]] = read(address)
+            elif op == STI:
+                write(read((pc + d[2]) & 0xFFFF), reg[d[1]])
+                if self.status is not None:
+                    break
+                continue
+            elif op == TRAP:
+                reg[7] = pc
+                self.pc, self.cc = pc, cc
+                self.trap(d[1])
+                if self.status is not None:
+                    break
+                continue
+            else:
+                self.status = 'rti' if op == RTI else 'reserved'
+                pc = (pc - 1) & 0xFFFF
+                steps -= 1
+                break
+            cc = 2 if value == 0 else (4 if value & 0x8000 else 1)
+            if self.status is not None:
+                break
+        self.pc = pc
+        self.cc = cc
+        self.steps += steps
+        return self.status
+
+    def output_text(self):
+        return ''.join(self.output)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run an LC-3 program.')
+    parser.add_argument('program', help='.asm source or .obj image')
+    parser.add_argument('-i', '--input', default='', help='characters fed to GETC/IN')
+    parser.add_argument('-l', '--limit', type=int, help='stop after this many instructions')
+    args = parser.parse_args(argv)
+    simulator = Simulator(args.input)
+    if args.program.lower().endswith('.obj'):
+        simulator.load_obj(args.program)
+    else:
+        success, infos, results = assemble(open_file(args.program), path=args.program)
+        if not success:
+            for info in infos:
+                print(info)
+            return 1
+        simulator.load(results)
+    status = simulator.run(args.limit)
+    sys.stdout.write(simulator.output_text())
+    print('\n{} after {} instruction(s)'.format(status, simulator.steps))
+    return 0 if status == 'halt' else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
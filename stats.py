@@ -0,0 +1,77 @@
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+Phases = ('cache', 'lex', 'pass1', 'pass2', 'write')
+
+
+# collects the time of each phase of an assembly and counts about the source;
+# pass one to assemble_image(). With trace_memory the peak
+# allocation of each phase is measured too, which makes assembling several
+# times slower. callback(phase, seconds) is called as each phase ends
+class Stats:
+    def __init__(self, trace_memory=False, callback=None):
+        self.trace_memory = trace_memory
+        self.callback = callback
+        self.times = {}
+        self.peaks = {}
+        self.counts = {}
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['callback'] = None
+        return state
+
+    @contextmanager
+    def phase(self, name):
+        tracing = self.trace_memory and not tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.start()
+        elif self.trace_memory:
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.times[name] = self.times.get(name, 0) + elapsed
+            if self.trace_memory:
+                self.peaks[name] = max(self.peaks.get(name, 0), tracemalloc.get_traced_memory()[1])
+            if tracing:
+                tracemalloc.stop()
+            if self.callback is not None:
+                self.callback(name, elapsed)
+
+    def count(self, name, value):
+        self.counts[name] = self.counts.get(name, 0) + value
+
+    def maximum(self, name, value):
+        self.counts[name] = max(self.counts.get(name, 0), value)
+
+    # adds up the stats of several files; largest_* counts keep the maximum
+    def add(self, other):
+        for name, elapsed in other.times.items():
+            self.times[name] = self.times.get(name, 0) + elapsed
+        for name, peak in other.peaks.items():
+            self.peaks[name] = max(self.peaks.get(name, 0), peak)
+        for name, value in other.counts.items():
+            if name.startswith('largest_'):
+                self.maximum(name, value)
+            else:
+                self.count(name, value)
+
+    def total(self):
+        return sum(self.times.values())
+
+    def report(self):
+        phases = ['{} {:.1f} ms'.format(name, self.times[name] * 1000) for name in Phases if name in self.times]
+        lines = ['time: ' + ', '.join(phases + ['total {:.1f} ms'.format(self.total() * 1000)])]
+        if self.counts:
+            lines.append('counts: ' + ', '.join('{} {}'.format(name, value)
+                                                for name, value in sorted(self.counts.items())))
+        if 'lines' in self.counts and self.total():
+            lines.append('throughput: {:.0f} lines/s'.format(self.counts['lines'] / self.total()))
+        if self.peaks:
+            lines.append('peak memory: ' + ', '.join('{} {:.1f} KiB'.format(name, self.peaks[name] / 1024)
+                                                     for name in Phases if name in self.peaks))
+        return lines
@@ -0,0 +1,93 @@
+from array import array
+from bisect import bisect_left, bisect_right
+
+
+# labels in definition order, kept in parallel arrays instead of one dict per
+# label; the address index used by the reverse lookups is sorted lazily, the
+# first time one of them is called after a change. lines stay a list, as the
+# line numbers of included files are preprocess.SourceLine with their path.
+# externals and globals are the names declared by .EXTERNAL and .GLOBAL
+class SymbolTable:
+    __slots__ = ('names', 'locs', 'lines', 'slots', 'externals', 'globals', '_order', '_addresses')
+
+    def __init__(self, symbols=(), externals=(), globals=()):
+        self.names = []
+        self.locs = array('l')
+        self.lines = []
+        self.slots = {}
+        self.externals = set(externals)
+        self.globals = set(globals)
+        self._order = None
+        self._addresses = None
+        for name, loc, line in symbols:
+            self.add(name, loc, line)
+
+    # a label defined again moves to its new location
+    def add(self, name, loc, line):
+        slot = self.slots.get(name)
+        if slot is None:
+            self.slots[name] = len(self.names)
+            self.names.append(name)
+            self.locs.append(loc)
+            self.lines.append(line)
+        else:
+            self.locs[slot] = loc
+            self.lines[slot] = line
+        self._order = None
+
+    def __contains__(self, name):
+        return name in self.slots
+
+    def __len__(self):
+        return len(self.names)
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def __eq__(self, other):
+        return isinstance(other, SymbolTable) and list(self.items()) == list(other.items()) and \
+            self.externals == other.externals and self.globals == other.globals
+
+    def loc(self, name):
+        return self.locs[self.slots[name]]
+
+    def line(self, name):
+        return self.lines[self.slots[name]]
+
+    def get(self, name, default=None):
+        slot = self.slots.get(name)
+        return default if slot is None else self.locs[slot]
+
+    # (name, loc, line) in definition order
+    def items(self):
+        return zip(self.names, self.locs, self.lines)
+
+    def index(self):
+        if self._order is None:
+            locs = self.locs
+            self._order = sorted(range(len(locs)), key=locs.__getitem__)
+            self._addresses = array('l', (locs[slot] for slot in self._order))
+        return self._order, self._addresses
+
+    # [(loc, name)] for start <= loc < stop, by address
+    def in_range(self, start, stop):
+        order, addresses = self.index()
+        names = self.names
+        return [(addresses[idx], names[order[idx]])
+                for idx in range(bisect_left(addresses, start), bisect_left(addresses, stop))]
+
+    def at(self, address):
+        return [name for _, name in self.in_range(address, address + 1)]
+
+    # (name, loc) of the closest label at or below address, or None; of several
+    # labels on one address the first defined wins
+    def nearest(self, address):
+        order, addresses = self.index()
+        idx = bisect_right(addresses, address)
+        if not idx:
+            return None
+        idx = bisect_left(addresses, addresses[idx - 1])
+        return self.names[order[idx]], addresses[idx]
+
+    def to_list(self):
+        return [list(item) for item in self.items()]